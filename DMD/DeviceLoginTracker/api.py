@@ -0,0 +1,231 @@
+import argparse
+import base64
+import hmac
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+from profiler import prometheus_cache_text, prometheus_text
+from utils import (
+    STORAGE_ENGINE, initialize_data, assign_devices, bulk_return_devices, get_active_assignments,
+    count_device_history, get_device_history_page, get_user, cache_stats
+)
+
+# Optional shared secret; when set, requests need "Authorization: Bearer <token>"
+API_TOKEN = os.environ.get('DMD_API_TOKEN')
+
+# Largest history page a client can ask for
+MAX_PAGE_SIZE = 1000
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def _iso(value):
+    """ISO text for a timestamp, None for NaT"""
+    return None if pd.isna(value) else pd.Timestamp(value).isoformat()
+
+
+def _records(frame):
+    """Assignments frame as a list of JSON-ready dicts"""
+    return [
+        {
+            'device_id': int(row.device_id),
+            'device_type': str(row.device_type),
+            'employee_name': str(row.employee_name),
+            'checkout_time': _iso(row.checkout_time),
+            'checkin_time': _iso(row.checkin_time)
+        }
+        for row in frame.itertuples(index=False)
+    ]
+
+
+def _encode_cursor(cursor):
+    """Opaque text form of a store history cursor"""
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode()
+
+
+def _decode_cursor(text):
+    """Store history cursor from its text form"""
+    if not text:
+        return None
+    return tuple(json.loads(base64.urlsafe_b64decode(text.encode())))
+
+
+class ApiError(Exception):
+    """Request problem reported to the client as {'error': message}"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """JSON endpoints over the same store the dashboard uses
+
+    GET  /health                    -> {"status": "ok"}
+    GET  /metrics                   -> Prometheus text (timings recorded with DMD_PROFILE=1, cache counters)
+    GET  /active                    -> {"assignments": [...]}
+    GET  /history?device_id=&device_type=&employee_name=&start=&end=&limit=&cursor=
+                                    -> {"total": n, "assignments": [...], "next_cursor": ...}
+    POST /checkout {"employee_name": "000002", "device_ids": [12, 40]}  (or "device_id": 12)
+    POST /return   {"device_ids": [12, 40]}                             (or "device_id": 12)
+
+    Checkouts and returns with several devices are all-or-nothing; a refused
+    request answers 409 with one message per device.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle({
+            '/health': self._health,
+            '/metrics': self._metrics,
+            '/active': self._active,
+            '/history': self._history,
+        })
+
+    def do_POST(self):
+        self._handle({
+            '/checkout': self._checkout,
+            '/return': self._return,
+        })
+
+    def _handle(self, routes):
+        """Authenticate, route and answer one request"""
+        try:
+            if API_TOKEN and not hmac.compare_digest(self.headers.get('Authorization', '').encode(),
+                                                     f'Bearer {API_TOKEN}'.encode()):
+                raise ApiError(401, 'Missing or wrong API token')
+            url = urlparse(self.path)
+            route = routes.get(url.path)
+            if route is None:
+                raise ApiError(404, f'No such endpoint: {url.path}')
+            status, body = route(url)
+        except ApiError as e:
+            status, body = e.status, {'error': str(e)}
+        except (ValueError, KeyError, TypeError) as e:
+            status, body = 400, {'error': f'Bad request: {e}'}
+        self._send(status, body)
+
+    def _send(self, status, body):
+        """Write a JSON response (or plain text when body is a string)"""
+        if isinstance(body, str):
+            data, content_type = body.encode(), 'text/plain; version=0.0.4'
+        else:
+            data, content_type = json.dumps(body).encode(), 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _json_body(self):
+        """Parse the request body as a JSON object"""
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not isinstance(body, dict):
+            raise ApiError(400, 'Expected a JSON object')
+        return body
+
+    @staticmethod
+    def _device_ids(body):
+        """Device IDs from a "device_id" or "device_ids" field (an integer or a list of integers)"""
+        device_ids = body['device_ids'] if 'device_ids' in body else body['device_id']
+        if not isinstance(device_ids, list):
+            device_ids = [device_ids]
+        if not device_ids:
+            raise ApiError(400, 'No devices given')
+        # bool is an int subclass, and a string would be read one character at a time
+        if not all(isinstance(device_id, int) and not isinstance(device_id, bool) for device_id in device_ids):
+            raise ApiError(400, 'Device IDs must be integers')
+        return device_ids
+
+    # Endpoints
+
+    def _health(self, url):
+        return 200, {'status': 'ok'}
+
+    def _metrics(self, url):
+        return 200, prometheus_text() + prometheus_cache_text(cache_stats())
+
+    def _active(self, url):
+        return 200, {'assignments': _records(get_active_assignments())}
+
+    def _history(self, url):
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        filters = {
+            'device_id': int(query['device_id']) if query.get('device_id') else None,
+            'device_type': query.get('device_type') or None,
+            'employee_name': query.get('employee_name') or None,
+            'start': pd.Timestamp(query['start']) if query.get('start') else None,
+            'end': pd.Timestamp(query['end']) if query.get('end') else None,
+        }
+        limit = min(int(query.get('limit', 50)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ApiError(400, 'limit must be at least 1')
+        page, next_cursor = get_device_history_page(limit, cursor=_decode_cursor(query.get('cursor')), **filters)
+        return 200, {
+            'total': count_device_history(**filters),
+            'assignments': _records(page),
+            'next_cursor': _encode_cursor(next_cursor)
+        }
+
+    def _checkout(self, url):
+        body = self._json_body()
+        employee_name = str(body['employee_name'])
+        if get_user(employee_name) is None:
+            raise ApiError(400, f'Unknown Employee ID: {employee_name}')
+        success, messages = assign_devices(employee_name, self._device_ids(body))
+        return (200 if success else 409), {'success': success, 'messages': messages}
+
+    def _return(self, url):
+        success, report = bulk_return_devices(self._device_ids(self._json_body()))
+        results = [
+            {'device_id': int(row['Device ID']), 'employee_name': row['Employee ID'], 'result': row['Result']}
+            for _, row in report.iterrows()
+        ]
+        return (200 if success else 409), {'success': success, 'results': results}
+
+    def log_message(self, format, *args):
+        """Keep the console quiet; scanners make a lot of requests"""
+        pass
+
+
+def start_api_server(host='127.0.0.1', port=8502):
+    """Serve the API from a background thread of this process (once per process)
+
+    Running inside the Streamlit process shares its in-memory store, so the
+    journal engine can be used; a separate process needs DMD_STORAGE=sqlite.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            initialize_data()
+            _server = ThreadingHTTPServer((host, port), ApiHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name='dmd-api', daemon=True).start()
+    return _server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Device Management JSON API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+
+    initialize_data()
+    server = ThreadingHTTPServer((args.host, args.port), ApiHandler)
+    server.daemon_threads = True
+    print(f"Serving the Device Management API on http://{args.host}:{args.port}")
+    if STORAGE_ENGINE != 'sqlite':
+        print("Note: the journal engine is per-process. Do not run the dashboard on the same files at the "
+              "same time; use DMD_STORAGE=sqlite or set DMD_API_PORT for the dashboard instead.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
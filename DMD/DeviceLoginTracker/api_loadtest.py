@@ -0,0 +1,128 @@
+import argparse
+import csv
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from devices import DEVICE_RANGES
+from journal import read_journal
+
+
+def request(base_url, method, path, body=None, token=None):
+    """Send one API request, returns (status, parsed JSON body)"""
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    req.add_header('Content-Type', 'application/json')
+    if token:
+        req.add_header('Authorization', f'Bearer {token}')
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+def roster_athletes(users_path):
+    """Usernames of the athletes on the roster: users.csv plus its unreplayed journal"""
+    with open(users_path, newline='', encoding='utf-8') as f:
+        roles = {row['username']: row['role'] for row in csv.DictReader(f)}
+    journal_path = os.path.splitext(users_path)[0] + '.journal'
+    for record in read_journal(journal_path + '.old') + read_journal(journal_path):
+        if record['op'] == 'add':
+            roles[record['user']['username']] = record['user']['role']
+        elif record['op'] == 'update':
+            for username, fields in record['changes'].items():
+                if username in roles and 'role' in fields:
+                    roles[username] = fields['role']
+        elif record['op'] == 'remove':
+            roles.pop(record['username'], None)
+    return [username for username, role in roles.items() if role == 'athlete']
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def scanner(base_url, employees, requests_per_worker, token, seed, latencies, statuses, lock):
+    """Simulate one handheld scanner: check a random device out, then return it"""
+    rng = random.Random(seed)
+    first = min(first for _, first, _ in DEVICE_RANGES)
+    last = max(last for _, _, last in DEVICE_RANGES)
+    device_id = None
+    for i in range(requests_per_worker):
+        if i % 2 == 0:
+            device_id = rng.randint(first, last)
+            body = {'employee_name': rng.choice(employees), 'device_id': device_id}
+            path = '/checkout'
+        else:
+            body = {'device_id': device_id}
+            path = '/return'
+        start = time.perf_counter()
+        status, _ = request(base_url, 'POST', path, body, token)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.setdefault(path, []).append(elapsed)
+            counts = statuses.setdefault(path, {})
+            counts[status] = counts.get(status, 0) + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test for the Device Management JSON API')
+    parser.add_argument('--url', default='http://127.0.0.1:8502')
+    parser.add_argument('--workers', type=int, default=20, help='concurrent scanners')
+    parser.add_argument('--requests', type=int, default=100, help='requests per scanner')
+    parser.add_argument('--employees', default=None,
+                        help='comma separated Employee IDs to check out to (default: every athlete in --users)')
+    parser.add_argument('--users', default='users.csv', help='roster to take the default Employee IDs from')
+    parser.add_argument('--token', default=None)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    status, _ = request(args.url, 'GET', '/health', token=args.token)
+    if status != 200:
+        raise SystemExit(f"API not healthy at {args.url} (status {status})")
+
+    employees = args.employees.split(',') if args.employees else roster_athletes(args.users)
+    if not employees:
+        raise SystemExit(f"No athletes in {args.users}; add some or pass --employees")
+    latencies = {}
+    statuses = {}
+    lock = threading.Lock()
+    workers = [
+        threading.Thread(target=scanner, args=(args.url, employees, args.requests, args.token,
+                                               args.seed + i, latencies, statuses, lock))
+        for i in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total} requests in {elapsed:.2f} s ({total / elapsed:.0f} req/s), "
+          f"{args.workers} workers")
+    for path, counts in sorted(statuses.items()):
+        print(f"{path:10} status codes: {dict(sorted(counts.items()))}")
+    for path, values in sorted(latencies.items()):
+        ms = [v * 1000 for v in values]
+        print(f"{path:10} n={len(ms):5}  mean={statistics.mean(ms):7.1f} ms  "
+              f"p50={percentile(ms, 50):7.1f} ms  p95={percentile(ms, 95):7.1f} ms  "
+              f"p99={percentile(ms, 99):7.1f} ms")
+
+    status, body = request(args.url, 'GET', '/active', token=args.token)
+    print(f"Devices checked out at the end: {len(body.get('assignments', []))}")
+
+
+if __name__ == '__main__':
+    main()
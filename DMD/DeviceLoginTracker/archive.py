@@ -0,0 +1,369 @@
+import os
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from journal import fsync_directory
+from schema import FACET_COLUMNS, assignment_frame
+
+# Same compact types as the in-memory frame; the categoricals are stored
+# dictionary-encoded
+ARCHIVE_SCHEMA = pa.schema([
+    ('device_id', pa.int16()),
+    ('employee_name', pa.dictionary(pa.int32(), pa.string())),
+    ('checkout_time', pa.timestamp('ns')),
+    ('checkin_time', pa.timestamp('ns')),
+    ('device_type', pa.dictionary(pa.int8(), pa.string())),
+])
+
+
+# A month's part files are merged into one once there are this many, so a
+# filtered query opens at most this many files per month
+COMPACT_PARTS = 8
+
+
+def _month(timestamp):
+    """Partition name ('YYYY-MM') for a timestamp"""
+    return pd.Timestamp(timestamp).strftime('%Y-%m')
+
+
+def _generation(name):
+    """Generation number in a file name like part-00000012-<uuid>.parquet (0 for older names)"""
+    fields = name.split('.')[0].split('-')
+    return int(fields[1]) if len(fields) == 3 else 0
+
+
+def _count_rows(frame):
+    """Month index entry for some rows: {'rows': n, column: {value: rows}} for each facet column"""
+    counts = {'rows': len(frame)}
+    for column in FACET_COLUMNS:
+        values = frame[column].astype(object).value_counts(sort=False)
+        counts[column] = {value: count for value, count in zip(values.index.tolist(), values.tolist()) if count}
+    return counts
+
+
+def _add_counts(counts, more):
+    """New month index entry holding the rows of both (entries are never changed in place)"""
+    total = {'rows': counts['rows'] + more['rows']}
+    for column in FACET_COLUMNS:
+        values = dict(counts[column])
+        for value, count in more[column].items():
+            values[value] = values.get(value, 0) + count
+        total[column] = values
+    return total
+
+
+NO_ROWS = {'rows': 0, **{column: {} for column in FACET_COLUMNS}}
+
+
+def _write_parquet(rows, path):
+    """Write assignment rows to a Parquet file, sorted by checkout time, and fsync it"""
+    table = pa.Table.from_pandas(
+        rows.sort_values(['checkout_time']),
+        schema=ARCHIVE_SCHEMA,
+        preserve_index=False
+    )
+    with open(path, 'wb') as f:
+        pq.write_table(table, f)
+        f.flush()
+        os.fsync(f.fileno())
+    fsync_directory(path)
+
+
+class AssignmentArchive:
+    """Columnar archive of returned assignments, partitioned by checkout month
+
+    Rows are written once, as Parquet files under root/month=YYYY-MM/, and
+    never change again (merging only moves them into fewer files). Queries
+    skip months outside the requested date range and read only the columns
+    they need.
+
+    Files are first written with a .pending suffix and published by
+    publish_pending() once the checkpoint that removed the rows from the
+    live store has completed.
+
+    Each file name carries a generation number that grows within its month.
+    compact() merges a month's files into one merged-<generation> file that
+    supersedes every file of that generation or older, so readers switch to
+    it the moment it is renamed into place and a crash before the old files
+    are deleted never shows rows twice.
+
+    A month index in memory counts each month's rows per device ID, device
+    type and employee. Queries skip the months without the filtered values,
+    and counts over whole months are read from it without opening files.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        # {month: counts}, built by the first snapshot(); publishing replaces
+        # a month's entry so older snapshots keep theirs
+        self._index = None
+        # Counts of the pending files written by append(), by path
+        self._pending_counts = {}
+
+    # Writing
+
+    def append(self, frame):
+        """Write closed assignments as pending part files, one per month"""
+        if frame.empty:
+            return
+        frame = assignment_frame(frame)
+        months = frame['checkout_time'].dt.strftime('%Y-%m')
+        for month, rows in frame.groupby(months):
+            directory = os.path.join(self.root, f'month={month}')
+            os.makedirs(directory, exist_ok=True)
+            generation = max([_generation(name) for name in os.listdir(directory)], default=0) + 1
+            path = os.path.join(directory, f'part-{generation:08d}-{uuid.uuid4().hex}.parquet.pending')
+            _write_parquet(rows, path)
+            self._pending_counts[path] = _count_rows(rows)
+
+    def pending_files(self):
+        """Part files written by a checkpoint that has not completed"""
+        paths = []
+        for month in self.months():
+            directory = os.path.join(self.root, f'month={month}')
+            paths.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                         if name.endswith('.parquet.pending'))
+        return paths
+
+    def read_pending(self):
+        """Read the rows in pending part files"""
+        paths = self.pending_files()
+        if not paths:
+            return assignment_frame()
+        return self._read(paths)
+
+    def publish_pending(self):
+        """Make pending part files visible to queries"""
+        for path in self.pending_files():
+            published = path[:-len('.pending')]
+            counts = self._pending_counts.pop(path, None)
+            os.replace(path, published)
+            fsync_directory(path)
+            if self._index is not None:
+                if counts is None:
+                    # Left by an interrupted checkpoint of an earlier process
+                    counts = _count_rows(self._read([published], columns=FACET_COLUMNS))
+                month = os.path.basename(os.path.dirname(path))[len('month='):]
+                self._index[month] = _add_counts(self._index.get(month, NO_ROWS), counts)
+
+    def compact(self):
+        """Merge the files of every month that has COMPACT_PARTS or more
+
+        Callers must hold the store lock (no appends meanwhile). Readers that
+        listed the old files may find them gone and should retry with a new
+        snapshot().
+        """
+        for month in self.months():
+            directory = os.path.join(self.root, f'month={month}')
+            names = self._live_names(directory)
+            if len(names) < COMPACT_PARTS:
+                continue
+            rows = self._read([os.path.join(directory, name) for name in names])
+            generation = max(_generation(name) for name in names)
+            path = os.path.join(directory, f'merged-{generation:08d}-{uuid.uuid4().hex}.parquet')
+            _write_parquet(rows, path + '.tmp')
+            os.replace(path + '.tmp', path)
+            fsync_directory(path)
+            # Everything else published in the month is now superseded
+            keep = set(self._live_names(directory))
+            for name in os.listdir(directory):
+                if name.endswith('.parquet') and name not in keep:
+                    os.remove(os.path.join(directory, name))
+            fsync_directory(path)
+
+    # Reading
+
+    def months(self):
+        """Archived months, oldest first"""
+        months = []
+        for name in os.listdir(self.root):
+            if name.startswith('month='):
+                months.append(name[len('month='):])
+        return sorted(months)
+
+    @staticmethod
+    def _live_names(directory):
+        """Published files of one month that queries should read, oldest generation first
+
+        The newest merged file replaces every file of its generation or older.
+        """
+        names = [name for name in os.listdir(directory) if name.endswith('.parquet')]
+        merged = [name for name in names if name.startswith('merged-')]
+        if merged:
+            newest = max(merged, key=lambda name: (_generation(name), name))
+            names = [newest] + [name for name in names if _generation(name) > _generation(newest)]
+        return sorted(names, key=lambda name: (_generation(name), name))
+
+    def snapshot(self):
+        """The files to read and the month index entry, by month: {month: (paths, counts)}
+
+        Take it while holding the store lock, together with the live rows, so
+        a checkpoint cannot move rows into the archive in between.
+        """
+        files = {}
+        for month in self.months():
+            directory = os.path.join(self.root, f'month={month}')
+            files[month] = [os.path.join(directory, name) for name in self._live_names(directory)]
+        if self._index is None:
+            # First use: read the facet columns of every month once
+            self._index = {
+                month: _count_rows(self._read(paths, columns=FACET_COLUMNS)) if paths else NO_ROWS
+                for month, paths in files.items()
+            }
+        return {month: (paths, self._index.get(month, NO_ROWS)) for month, paths in files.items()}
+
+    @staticmethod
+    def _files(snapshot, months=None):
+        """Files of a snapshot in the given months (all months by default)"""
+        paths = []
+        for month in months if months is not None else sorted(snapshot):
+            paths.extend(snapshot[month][0] if month in snapshot else [])
+        return paths
+
+    @staticmethod
+    def _wanted(device_id, device_type, employee_name):
+        """The (facet column, value) pairs a query filters on"""
+        wanted = []
+        if device_id is not None:
+            wanted.append(('device_id', int(device_id)))
+        if device_type is not None:
+            wanted.append(('device_type', device_type))
+        if employee_name is not None:
+            wanted.append(('employee_name', employee_name))
+        return wanted
+
+    def _matching_months(self, snapshot, device_id, device_type, employee_name, start, end):
+        """Months in the date range whose index has rows for every filtered value"""
+        wanted = self._wanted(device_id, device_type, employee_name)
+        return [
+            month for month in self._months_between(snapshot, start, end)
+            if all(snapshot[month][1][column].get(value) for column, value in wanted)
+        ]
+
+    @staticmethod
+    def _months_between(snapshot, start, end):
+        """Archived months that can hold checkouts between start and end"""
+        first = _month(start) if start is not None else None
+        last = _month(end) if end is not None else None
+        return [
+            month for month in sorted(snapshot)
+            if (first is None or month >= first) and (last is None or month <= last)
+        ]
+
+    def _read(self, paths, columns=None, filters=None):
+        """Read part files into a frame"""
+        tables = [pq.read_table(path, columns=columns, filters=filters) for path in paths]
+        if not tables:
+            frame = assignment_frame()
+            return frame[columns] if columns is not None else frame
+        frame = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+        if columns is None:
+            # Unify the per-file dictionaries into one set of categories
+            frame = assignment_frame(frame)
+        return frame
+
+    @staticmethod
+    def _filters(device_id, device_type, employee_name, start, end):
+        """Parquet predicates for the history filters"""
+        filters = []
+        if device_id is not None:
+            filters.append(('device_id', '=', int(device_id)))
+        if device_type is not None:
+            filters.append(('device_type', '=', device_type))
+        if employee_name is not None:
+            filters.append(('employee_name', '=', employee_name))
+        if start is not None:
+            filters.append(('checkout_time', '>=', pd.Timestamp(start)))
+        if end is not None:
+            filters.append(('checkout_time', '<=', pd.Timestamp(end)))
+        return filters or None
+
+    def scan(self, device_id=None, device_type=None, employee_name=None, start=None, end=None,
+             columns=None, months=None, snapshot=None):
+        """Read the archived rows matching the filters (in no particular order)"""
+        if snapshot is None:
+            snapshot = self.snapshot()
+        if months is None:
+            months = self._matching_months(snapshot, device_id, device_type, employee_name, start, end)
+        return self._read(
+            self._files(snapshot, months),
+            columns=columns,
+            filters=self._filters(device_id, device_type, employee_name, start, end)
+        )
+
+    def count(self, device_id=None, device_type=None, employee_name=None, start=None, end=None,
+              snapshot=None):
+        """Count archived rows matching the filters"""
+        if snapshot is None:
+            snapshot = self.snapshot()
+        filters = self._filters(device_id, device_type, employee_name, start, end)
+        wanted = self._wanted(device_id, device_type, employee_name)
+        total = 0
+        for month in self._matching_months(snapshot, device_id, device_type, employee_name, start, end):
+            paths, counts = snapshot[month]
+            inside_range = (start is None or _month(start) < month) and (end is None or month < _month(end))
+            if inside_range and len(wanted) <= 1:
+                # The whole month matches at most one filter: the month index has the count
+                total += counts[wanted[0][0]][wanted[0][1]] if wanted else counts['rows']
+            else:
+                total += len(self._read(paths, columns=['checkout_time'], filters=filters))
+        return total
+
+    def page(self, limit, cursor=None, device_id=None, device_type=None, employee_name=None,
+             start=None, end=None, snapshot=None):
+        """Return up to limit matching rows older than cursor, newest first
+
+        Months are read newest first, a batch at a time: the month index says
+        how many of the newest months can fill the page, and those are read
+        together. Reading stops as soon as enough rows have been found.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        months = self._matching_months(snapshot, device_id, device_type, employee_name, start, end)
+        if cursor is not None:
+            cursor_month = _month(pd.Timestamp(cursor[0]))
+            months = [month for month in months if month <= cursor_month]
+        months.reverse()
+        wanted = self._wanted(device_id, device_type, employee_name)
+
+        found = []
+        count = 0
+        while months and count < limit:
+            batch = []
+            expected = 0
+            while months and expected < limit - count:
+                # At most this many matches (fewer for a partial month or several filters)
+                counts = snapshot[months[0]][1]
+                expected += min([counts[column][value] for column, value in wanted], default=counts['rows'])
+                batch.append(months.pop(0))
+            rows = self.scan(device_id, device_type, employee_name, start, end, months=batch,
+                             snapshot=snapshot)
+            if rows.empty:
+                continue
+            rows = rows.assign(
+                _time=rows['checkout_time'].astype('int64'),
+                _device=rows['device_id']
+            )
+            if cursor is not None:
+                rows = rows[
+                    (rows['_time'] < cursor[0]) |
+                    ((rows['_time'] == cursor[0]) & (rows['_device'] < cursor[1]))
+                ]
+            found.append(rows)
+            count += len(rows)
+        if not found:
+            return assignment_frame()
+        rows = pd.concat(found, ignore_index=True).sort_values(['_time', '_device'], ascending=False)
+        return assignment_frame(rows.head(limit).reset_index(drop=True))
+
+    def value_counts(self, column, snapshot=None):
+        """Number of archived rows per value of a facet column (from the month index)"""
+        if snapshot is None:
+            snapshot = self.snapshot()
+        counts = {}
+        for month in sorted(snapshot):
+            for value, count in snapshot[month][1][column].items():
+                counts[value] = counts.get(value, 0) + count
+        return counts
@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import utils
+from api_loadtest import percentile
+from devices import DEVICE_RANGES
+from passwords import hash_password
+from schema import ASSIGNMENT_COLUMNS, DEVICE_TYPES
+
+# Password every generated user gets (hashed once and shared, hashing is slow)
+BENCHMARK_PASSWORD = 'benchmark'
+
+# Devices left checked out while the read operations run, like mid-shift
+DEVICES_OUT = 20
+
+# A result this much slower than the baseline (p50) is reported as a
+# regression, unless it is within REGRESSION_MIN_MS (timer noise)
+REGRESSION_RATIO = 1.25
+REGRESSION_MIN_MS = 1.0
+
+
+def generate_users(count, seed):
+    """Users frame with count athletes plus the default admin"""
+    rng = random.Random(seed)
+    first_names = ['Ali', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie']
+    last_names = ['Motley', 'Nguyen', 'Garcia', 'Smith', 'Okafor', 'Rossi', 'Kim', 'Brown']
+    password = hash_password(BENCHMARK_PASSWORD)
+    usernames = ['000001'] + [f"{100000 + i:06d}" for i in range(count)]
+    return pd.DataFrame({
+        'username': usernames,
+        'password': password,
+        'role': ['coach'] + ['athlete'] * count,
+        'first_name': ['Jelisha'] + [rng.choice(first_names) for _ in range(count)],
+        'last_name': ['Joseph'] + [rng.choice(last_names) for _ in range(count)]
+    })
+
+
+def generate_history(rows, usernames, years, seed, end=None):
+    """Returned assignments spread over the last `years` years
+
+    Each device's checkouts are sorted and every check-in comes before the
+    device's next checkout, so the history could really have happened.
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end or datetime.now()).floor('s').value
+    start = end - int(years * 365 * 24 * 3600 * 1e9)
+    device_ids = np.array([i for _, first, last in DEVICE_RANGES for i in range(first, last + 1)])
+    type_of = {i: name for name, first, last in DEVICE_RANGES for i in range(first, last + 1)}
+
+    devices = np.sort(rng.choice(device_ids, size=rows))
+    checkout = rng.integers(start, end, size=rows)
+    order = np.lexsort((checkout, devices))
+    devices, checkout = devices[order], checkout[order]
+
+    # Next checkout of the same device (or the end of the range) bounds the check-in
+    next_checkout = np.append(checkout[1:], end)
+    next_checkout[np.append(devices[1:] != devices[:-1], True)] = end
+    shift = int(10 * 3600 * 1e9)
+    gap = np.maximum(next_checkout - checkout, 2)
+    duration = np.minimum(rng.integers(60 * 10**9, shift, size=rows), gap - 1)
+    duration = np.maximum(duration, 1)
+
+    return pd.DataFrame({
+        'device_id': devices.astype('int16'),
+        'employee_name': np.asarray(usernames)[rng.integers(0, len(usernames), size=rows)],
+        'checkout_time': pd.to_datetime(checkout),
+        'checkin_time': pd.to_datetime(checkout + duration),
+        'device_type': pd.Series(devices).map(type_of).to_numpy()
+    }, columns=ASSIGNMENT_COLUMNS)
+
+
+def _reset_store():
+    """Forget the process-wide store so the next call opens it from disk"""
+    utils._store = None
+    utils.startup_timings.clear()
+
+
+def _measure(func, repeat, setup=None):
+    """Call func repeat times, returns the latency summary in milliseconds
+
+    setup, if given, runs untimed before each call.
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'n': len(samples),
+        'mean_ms': statistics.mean(samples),
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99),
+        'max_ms': max(samples)
+    }
+
+
+def _peak_memory(func):
+    """Bytes allocated at the peak of one call to func (Python and numpy allocations)"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _operations(usernames, rng, history_end):
+    """The data layer calls to benchmark, as {name: zero-argument function}
+
+    Checks DEVICES_OUT devices out first so the reads see a mid-shift store.
+    """
+    athletes = [name for name in usernames if name != '000001']
+    month_start = history_end - pd.Timedelta(days=30)
+    # The first DEVICES_OUT athletes keep their devices; checkouts cycle through the rest
+    state = {'device': None, 'next': DEVICES_OUT}
+
+    def assign():
+        athlete = athletes[state['next']]
+        state['next'] = max(DEVICES_OUT, (state['next'] + 1) % len(athletes))
+        free = utils.get_available_devices(rng.choice(DEVICE_TYPES))
+        state['device'] = rng.choice(free)
+        utils.assign_device(athlete, state['device'])
+
+    def return_last():
+        if state['device'] is not None:
+            utils.return_device(state['device'])
+            state['device'] = None
+
+    # Check devices out to the first DEVICES_OUT athletes and leave them out
+    for athlete in athletes[:DEVICES_OUT]:
+        device_type = rng.choice(DEVICE_TYPES)
+        utils.assign_device(athlete, rng.choice(utils.get_available_devices(device_type)))
+
+    def history_page(**filters):
+        utils.count_device_history(**filters)
+        utils.get_device_history_page(50, **filters)
+
+    return {
+        'assign_device': assign,
+        'return_device': return_last,
+        'get_active_assignments': utils.get_active_assignments,
+        'get_available_devices': lambda: utils.get_available_devices(rng.choice(DEVICE_TYPES)),
+        'get_device_history (all)': utils.get_device_history,
+        'get_device_history (one device)': lambda: utils.get_device_history(device_id=rng.randint(1, 35)),
+        'history page (no filter)': history_page,
+        'history page (device)': lambda: history_page(device_id=rng.randint(1, 50)),
+        'history page (athlete)': lambda: history_page(employee_name=rng.choice(athletes)),
+        'history page (last 30 days)': lambda: history_page(start=month_start, end=history_end),
+        'history page (type + athlete + 30 days)': lambda: history_page(
+            device_type=rng.choice(DEVICE_TYPES), employee_name=rng.choice(athletes),
+            start=month_start, end=history_end),
+        'filter dropdown values': lambda: [utils.get_assignment_values(column)
+                                           for column in ['device_id', 'device_type', 'employee_name']],
+        'validate_user': lambda: utils.validate_user(rng.choice(athletes), BENCHMARK_PASSWORD),
+    }
+
+
+# Operations that are slow by design (whole history, password hashing) run fewer times
+_SLOW_OPERATIONS = {'get_device_history (all)', 'validate_user'}
+
+# Operations served from utils.cached_view. Their main numbers are taken with
+# the cache cleared before each call (what the data layer costs); the warm
+# p50 is what a repeat call costs until the next write.
+_CACHED_OPERATIONS = {
+    'get_active_assignments', 'history page (no filter)', 'history page (device)', 'history page (athlete)',
+    'history page (last 30 days)', 'history page (type + athlete + 30 days)', 'filter dropdown values'
+}
+
+
+def run_size(engine, rows, users, years, seed, repeat, workdir):
+    """Benchmark one engine at one history size, returns {'load': ..., 'operations': ...}"""
+    os.makedirs(workdir)
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        user_frame = generate_users(users, seed)
+        history_end = pd.Timestamp(datetime.now()).floor('s')
+        history = generate_history(rows, user_frame['username'], years, seed, end=history_end)
+        user_frame.to_csv('users.csv', index=False)
+        history.to_csv('device_assignments.csv', index=False)
+        del history
+
+        utils.STORAGE_ENGINE = engine
+        _reset_store()
+        load = {}
+        start = time.perf_counter()
+        utils.initialize_data()
+        load['first_open_ms'] = (time.perf_counter() - start) * 1000
+        if engine == 'journal':
+            # A store that built its history up through the journal would have
+            # archived the returned rows at its checkpoints by now
+            start = time.perf_counter()
+            utils.get_store().checkpoint()
+            load['archive_history_ms'] = (time.perf_counter() - start) * 1000
+
+        # What a container restart costs once the history has been loaded before
+        _reset_store()
+        start = time.perf_counter()
+        utils.initialize_data()
+        load['restart_ms'] = (time.perf_counter() - start) * 1000
+        load['restart_steps_ms'] = {name: seconds * 1000 for name, seconds in utils.startup_timings.items()}
+
+        # Memory held by the open store, and the peak while opening it
+        _reset_store()
+        tracemalloc.start()
+        utils.initialize_data()
+        load['retained_bytes'], load['peak_bytes'] = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rng = random.Random(seed)
+        operations = _operations(list(user_frame['username']), rng, history_end)
+        assign, return_last = operations['assign_device'], operations['return_device']
+        results = {}
+        for name, func in operations.items():
+            count = max(3, repeat // 20) if name in _SLOW_OPERATIONS else repeat
+            if name == 'assign_device':
+                # Return the previous checkout untimed so the number of devices out stays the same
+                results[name] = _measure(assign, count, setup=return_last)
+                return_last()
+            elif name == 'return_device':
+                results[name] = _measure(return_last, count, setup=assign)
+            else:
+                results[name] = _measure(func, count, setup=utils.clear_view_cache)
+                utils.clear_view_cache()
+                results[name]['peak_bytes'] = _peak_memory(func)
+                if name in _CACHED_OPERATIONS:
+                    results[name]['warm_p50_ms'] = _measure(func, count)['p50_ms']
+        return {'load': load, 'operations': results}
+    finally:
+        os.chdir(previous_dir)
+        _reset_store()
+
+
+def compare(results, baseline):
+    """Print p50 changes against a saved baseline, returns the regressions"""
+    regressions = []
+    for key, run in results['runs'].items():
+        old_run = baseline.get('runs', {}).get(key)
+        if old_run is None:
+            continue
+        print(f"\n{key} vs baseline")
+        for name, summary in run['operations'].items():
+            old = old_run['operations'].get(name)
+            if old is None or not old['p50_ms']:
+                continue
+            ratio = summary['p50_ms'] / old['p50_ms']
+            slower = ratio > REGRESSION_RATIO and summary['p50_ms'] - old['p50_ms'] > REGRESSION_MIN_MS
+            flag = '  <- slower' if slower else ''
+            print(f"  {name:42} {old['p50_ms']:9.2f} -> {summary['p50_ms']:9.2f} ms  x{ratio:5.2f}{flag}")
+            if flag:
+                regressions.append((key, name, ratio))
+    return regressions
+
+
+def _print_run(key, run):
+    """Print one engine/size result as a table"""
+    load = run['load']
+    print(f"\n{key}: first open {load['first_open_ms']:.0f} ms, restart {load['restart_ms']:.0f} ms, "
+          f"retained {load['retained_bytes'] / 2**20:.1f} MiB, peak {load['peak_bytes'] / 2**20:.1f} MiB")
+    print(f"  {'operation':42} {'p50':>9} {'p95':>9} {'p99':>9}  {'peak MiB':>8}  {'warm p50':>8}")
+    for name, summary in run['operations'].items():
+        peak = summary.get('peak_bytes')
+        peak_text = f"{peak / 2**20:8.2f}" if peak is not None else ' ' * 8
+        warm = summary.get('warm_p50_ms')
+        warm_text = f"{warm:8.2f}" if warm is not None else ''
+        print(f"  {name:42} {summary['p50_ms']:9.2f} {summary['p95_ms']:9.2f} "
+              f"{summary['p99_ms']:9.2f}  {peak_text}  {warm_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the utils.py data layer on generated history')
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='comma separated assignment history sizes (rows)')
+    parser.add_argument('--users', type=int, default=500, help='generated athletes')
+    parser.add_argument('--years', type=float, default=3, help='years of history to spread the rows over')
+    parser.add_argument('--engines', default='journal', help="comma separated: 'journal', 'sqlite'")
+    parser.add_argument('--repeat', type=int, default=200, help='calls per operation')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None, help='compare against a JSON file from an earlier run')
+    args = parser.parse_args()
+
+    if args.users <= DEVICES_OUT:
+        parser.error(f"--users must be more than {DEVICES_OUT}")
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'settings': {'users': args.users, 'years': args.years, 'repeat': args.repeat, 'seed': args.seed,
+                     'password_iterations': int(os.environ.get('DMD_PASSWORD_ITERATIONS', 600000))},
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__,
+                        'numpy': np.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'runs': {}
+    }
+
+    root = tempfile.mkdtemp(prefix='dmd-benchmark-')
+    try:
+        for engine in args.engines.split(','):
+            for rows in sizes:
+                key = f"{engine}/{rows}"
+                run = run_size(engine, rows, args.users, args.years, args.seed, args.repeat,
+                               os.path.join(root, key.replace('/', '-')))
+                results['runs'][key] = run
+                _print_run(key, run)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    results['max_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(f"\nMax RSS: {results['max_rss_bytes'] / 2**20:.0f} MiB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            raise SystemExit(f"{len(regressions)} operation(s) slower than x{REGRESSION_RATIO} of the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# Device inventory: each device type owns a contiguous range of device IDs
+DEVICE_RANGES = [
+    ('Athlete Device', 1, 35),
+    ('Payment Terminal', 36, 50),
+]
+
+MAX_DEVICE_ID = max(last for _, _, last in DEVICE_RANGES)
+
+
+def device_range(device_type):
+    """Return the (first, last) device IDs for a device type"""
+    for name, first, last in DEVICE_RANGES:
+        if name == device_type:
+            return first, last
+    raise ValueError(f"Unknown device type: {device_type}")
+
+
+class DeviceAvailability:
+    """Bitmap of checked-out device slots, indexed by device ID
+
+    One byte per slot keeps lookups and updates O(1) and lets the checkout
+    dropdowns list free devices without comparing against the active list.
+    """
+
+    def __init__(self, size=MAX_DEVICE_ID):
+        self._out = bytearray(size + 1)
+
+    def _grow(self, device_id):
+        """Extend the bitmap to cover device_id"""
+        if device_id >= len(self._out):
+            self._out.extend(bytes(device_id + 1 - len(self._out)))
+
+    def mark_out(self, device_id):
+        """Record that a device has been checked out"""
+        device_id = int(device_id)
+        self._grow(device_id)
+        self._out[device_id] = 1
+
+    def mark_in(self, device_id):
+        """Record that a device has been returned"""
+        device_id = int(device_id)
+        if device_id < len(self._out):
+            self._out[device_id] = 0
+
+    def available(self, device_type):
+        """IDs of the free devices of one type"""
+        first, last = device_range(device_type)
+        self._grow(last)
+        out = self._out
+        return [i for i in range(first, last + 1) if not out[i]]
@@ -0,0 +1,81 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import pandas as pd
+from sqlite_store import SQLiteStore
+from store import DEVICE_CHECKED_OUT, TYPE_ALREADY_HELD
+
+# Both racing rounds use devices of this type
+DEVICE_TYPE = 'Athlete Device'
+
+
+def race(path, worker, rounds, barrier, results):
+    """One replica: every round, try the same checkout as the other processes at the same moment
+
+    Even rounds: every process checks the same device out to its own athlete.
+    Odd rounds: every process checks a different device out to the same athlete.
+    """
+    store = SQLiteStore(path)
+    for round_number in range(rounds):
+        if round_number % 2 == 0:
+            assignment = {'device_id': 1, 'employee_name': f'{100 + worker:06d}'}
+        else:
+            assignment = {'device_id': 1 + worker, 'employee_name': '000100'}
+        assignment.update(checkout_time=pd.Timestamp.now(), device_type=DEVICE_TYPE)
+        barrier.wait()
+        results.put((round_number, worker, store.checkout(assignment)))
+        barrier.wait()
+        # One process returns the winner's device before the next round starts
+        if worker == 0:
+            active = store.get_active_assignments()
+            store.checkin_many(active['device_id'].tolist(), pd.Timestamp.now())
+        barrier.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Race several processes to check out the same device against one SQLite file')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=100)
+    parser.add_argument('--db', default=None, help='SQLite file to use (default: a new temporary one)')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'double_booking.db')
+    SQLiteStore(path)  # create the schema before the processes race to
+    # Spawned processes share nothing but the database file, like replicas
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(args.processes)
+    results = context.Queue()
+    workers = [
+        context.Process(target=race, args=(path, worker, args.rounds, barrier, results))
+        for worker in range(args.processes)
+    ]
+    for worker in workers:
+        worker.start()
+    outcomes = {}
+    for _ in range(args.processes * args.rounds):
+        round_number, worker, result = results.get()
+        outcomes.setdefault(round_number, []).append(result)
+    for worker in workers:
+        worker.join()
+
+    failures = []
+    for round_number, round_results in sorted(outcomes.items()):
+        refusal = DEVICE_CHECKED_OUT if round_number % 2 == 0 else TYPE_ALREADY_HELD
+        winners = round_results.count(None)
+        if winners != 1 or round_results.count(refusal) != len(round_results) - 1:
+            failures.append(f"round {round_number}: {winners} winners, results {round_results}")
+
+    print(f"{args.processes} processes, {args.rounds} rounds against {path}")
+    if failures or any(worker.exitcode != 0 for worker in workers):
+        for failure in failures:
+            print(f"  {failure}")
+        print("FAIL: a device or an athlete's device type was booked more than once")
+        sys.exit(1)
+    print("OK: every round had exactly one winner")
+
+
+if __name__ == '__main__':
+    main()
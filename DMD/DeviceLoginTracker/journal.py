@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+
+
+def fsync_directory(path):
+    """Flush a directory entry so a rename inside it survives a crash"""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_csv_atomic(frame, path):
+    """Replace a CSV file with a frame's contents so readers see old or new, never half
+
+    The frame is written to path + '.tmp', flushed to disk and renamed over
+    the original.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        frame.to_csv(f, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(path)
+
+
+def read_journal(path):
+    """Read every complete record from a journal file
+
+    A crash can leave a half-written last line; anything that does not parse
+    is the tail of an unacknowledged write and is dropped.
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+def truncate_torn_tail(path):
+    """Cut a journal back to the end of its last complete record
+
+    read_journal() stops at a torn line, so a record appended after one
+    would be lost on the next restart even though it was acknowledged.
+    """
+    if not os.path.exists(path):
+        return
+    good = 0
+    last = b''
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                if line.strip():
+                    json.loads(line)
+            except ValueError:
+                break
+            good += len(line)
+            last = line
+    size = os.path.getsize(path)
+    if good == size and (not last or last.endswith(b'\n')):
+        return
+    with open(path, 'r+b') as f:
+        f.truncate(good)
+        if not last.endswith(b'\n') and last.strip():
+            # The last record parsed but lost its newline; keep it on its own line
+            f.seek(good)
+            f.write(b'\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class Journal:
+    """Append-only log of device checkouts and check-ins
+
+    Writers call write() while holding the store lock, which fixes the order of
+    records, and then wait_durable() after releasing it. The first waiter to
+    find no flush in progress becomes the leader and writes and fsyncs every
+    record queued so far, so concurrent checkouts share a single fsync
+    (group commit).
+    """
+
+    def __init__(self, path, last_seq=0):
+        self.path = path
+        self._cond = threading.Condition()
+        truncate_torn_tail(path)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._pending = []
+        self._seq = last_seq
+        self._durable_seq = last_seq
+        self._flushing = False
+        self._error = None
+
+    @property
+    def seq(self):
+        """Sequence number of the last record written"""
+        return self._seq
+
+    def write(self, record):
+        """Queue a record for the next flush and return its sequence number"""
+        with self._cond:
+            self._seq += 1
+            record = dict(record, seq=self._seq)
+            self._pending.append(json.dumps(record, default=str) + '\n')
+            return self._seq
+
+    def wait_durable(self, seq):
+        """Block until the record with this sequence number is on disk"""
+        with self._cond:
+            while self._durable_seq < seq:
+                if self._error is not None:
+                    raise self._error
+                if self._flushing:
+                    self._cond.wait()
+                else:
+                    self._flush_locked()
+
+    def sync(self):
+        """Flush every queued record"""
+        self.wait_durable(self._seq)
+
+    def _flush_locked(self):
+        """Write and fsync the pending batch (called with the condition held)"""
+        batch = self._pending
+        batch_seq = self._seq
+        self._pending = []
+        self._flushing = True
+        # Release the condition during I/O so other writers can keep queueing
+        self._cond.release()
+        try:
+            self._file.write(''.join(batch))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            self._cond.acquire()
+            self._flushing = False
+            self._error = e
+            self._cond.notify_all()
+            raise
+        self._cond.acquire()
+        self._flushing = False
+        self._durable_seq = batch_seq
+        self._cond.notify_all()
+
+    def rotate(self):
+        """Move the current journal aside to path + '.old' and start a new one
+
+        Callers must hold the store lock so no new records arrive meanwhile.
+        """
+        self.sync()
+        with self._cond:
+            self._file.close()
+            os.replace(self.path, self.path + '.old')
+            self._file = open(self.path, 'a', encoding='utf-8')
+            fsync_directory(self.path)
+
+    def discard_rotated(self):
+        """Remove the rotated journal once a checkpoint covers it"""
+        if os.path.exists(self.path + '.old'):
+            os.remove(self.path + '.old')
+            fsync_directory(self.path)
+
+    def close(self):
+        """Flush and close the journal file"""
+        self.sync()
+        with self._cond:
+            self._file.close()
@@ -1,11 +1,49 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
-import hashlib
+import os
 from utils import (
-    initialize_data, hash_password, parse_user_agent,
-    return_device, get_active_assignments, get_device_history
+    initialize_data, validate_user, parse_user_agent,
+    assign_device, assign_devices, return_device, bulk_assign_devices, bulk_return_devices,
+    get_available_devices, get_active_assignments,
+    get_history_page_display, get_active_assignments_with_names, get_athlete_options, get_athlete_labels, get_user_options,
+    get_assignment_values, get_assignment_counts, get_users, cache_stats,
+    DATETIME_COLUMN_FORMAT, get_user, add_user, update_users,
+    reset_password, remove_user, validate_user_changes
 )
+from streamlit.errors import StreamlitAPIException
+from profiler import PROFILING, Profile, process_profile, section, use_session_profile
+
+# Page sizes offered on the History tab
+HISTORY_PAGE_SIZES = [25, 50, 100, 250]
+
+def rerun_fragment():
+    """Rerun only the fragment this is called from
+
+    Falls back to a full rerun when the fragment is running as part of one
+    (Streamlit only allows fragment-scoped reruns during fragment reruns).
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def count_labels(counts):
+    """Labels like "Athlete Device (1,234)" for a {value: number of assignments} dict"""
+    return {value: f"{value} ({count:,})" for value, count in counts.items()}
+
+def facet_selectbox(label, values, labels, state_key):
+    """Filter selectbox over ['All'] + values, showing labels[value] for each value
+
+    The labels carry live counts, and Streamlit treats a selectbox whose
+    labels changed as a new widget, so the last choice is kept in session
+    state under state_key and passed back as the index.
+    """
+    options = ['All'] + list(values)
+    previous = st.session_state.get(state_key, 'All')
+    index = options.index(previous) if previous in options else 0
+    choice = st.selectbox(label, options, index=index, format_func=lambda value: labels.get(value, value))
+    st.session_state[state_key] = choice
+    return choice
 
 # Initialize session state variables
 if 'authenticated' not in st.session_state:
@@ -21,13 +59,12 @@ if 'password_reset' not in st.session_state:
 if 'edit_mode' not in st.session_state:
     st.session_state.edit_mode = False
 
-# Detect if user is on mobile device
+# Detect if user is on mobile device (phones and tablets get the compact layout)
 if 'is_mobile' not in st.session_state:
     try:
-        user_agent = st.get_option('browser.serverAddress')
-        ua_info = parse_user_agent(st.request_headers.get('User-Agent', ''))
-        st.session_state.is_mobile = 'Mobile' in ua_info.get('device', '') or 'Tablet' in ua_info.get('device', '')
-    except:
+        ua_info = parse_user_agent(st.context.headers.get('User-Agent', ''))
+        st.session_state.is_mobile = ua_info['is_mobile']
+    except Exception:
         # Set to False if detection fails
         st.session_state.is_mobile = False
 
@@ -39,9 +76,20 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Timings of this rerun also go into the session's own profile (DMD_PROFILE=1)
+if PROFILING:
+    if 'profile' not in st.session_state:
+        st.session_state.profile = Profile()
+    use_session_profile(st.session_state.profile)
+
 # Initialize data (after page config)
 initialize_data()
 
+# Optionally serve the JSON API for scanners from this process, sharing its store
+if os.environ.get('DMD_API_PORT'):
+    from api import start_api_server
+    start_api_server(os.environ.get('DMD_API_HOST', '127.0.0.1'), int(os.environ['DMD_API_PORT']))
+
 # Add custom CSS with mobile and tablet optimizations
 st.markdown("""
 <style>
@@ -135,95 +183,63 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.fragment
 def athlete_device_checkout():
-    """Interface for athletes to check out devices"""
-    # Get the athlete's full name
-    user_data = st.session_state.users[st.session_state.users['username'] == st.session_state.current_user]
-    if not user_data.empty:
-        full_name = f"{user_data.iloc[0]['first_name']} {user_data.iloc[0]['last_name']}"
-    else:
-        full_name = st.session_state.current_user
-
-    st.markdown(f"## Welcome, {full_name}!")
-
-    # Get athlete's active checkouts
-    active_devices = get_active_assignments()
-    athlete_active_devices = active_devices[active_devices['employee_name'] == st.session_state.current_user]
-
-    # Show checked out devices
-    if not athlete_active_devices.empty:
-        st.subheader("Your Checked Out Devices")
-        for _, row in athlete_active_devices.iterrows():
-            col1, col2, col3 = st.columns([2, 2, 1])
-            with col1:
-                st.write(f"**Device:** {row['device_id']}")
-            with col2:
-                st.write(f"**Type:** {row['device_type']}")
-            with col3:
-                if st.button(f"Return Device {row['device_id']}"):
-                    if return_device(row['device_id']):
-                        st.success(f"Successfully returned {row['device_id']}")
-                        st.rerun()
+    """Interface for athletes to check out devices
+
+    Runs as a fragment: returning or checking out a device reruns only this
+    page body, not the whole app.
+    """
+    with section("Athlete Checkout"):
+        # Get the athlete's full name
+        user_data = get_user(st.session_state.current_user)
+        if user_data is not None:
+            full_name = f"{user_data['first_name']} {user_data['last_name']}"
+        else:
+            full_name = st.session_state.current_user
 
-    # Checkout new device
-    st.subheader("Check Out a Device")
+        st.markdown(f"## Welcome, {full_name}!")
 
-    # Generate device lists
-    athlete_devices = [str(i) for i in range(1, 36)]
-    payment_terminals = [str(i) for i in range(36, 51)]
+        # Get athlete's active checkouts
+        active_devices = get_active_assignments()
+        athlete_active_devices = active_devices[active_devices['employee_name'] == st.session_state.current_user]
 
-    # Get all currently checked out devices
-    all_active_device_ids = active_devices['device_id'].tolist()
+        # Show checked out devices
+        if not athlete_active_devices.empty:
+            st.subheader("Your Checked Out Devices")
+            for _, row in athlete_active_devices.iterrows():
+                col1, col2, col3 = st.columns([2, 2, 1])
+                with col1:
+                    st.write(f"**Device:** {row['device_id']}")
+                with col2:
+                    st.write(f"**Type:** {row['device_type']}")
+                with col3:
+                    if st.button(f"Return Device {row['device_id']}"):
+                        if return_device(row['device_id']):
+                            st.success(f"Successfully returned {row['device_id']}")
+                            rerun_fragment()
 
-    # Filter available devices (remove ones already checked out)
-    available_athlete_devices = [d for d in athlete_devices if d not in all_active_device_ids]
-    available_payment_terminals = [d for d in payment_terminals if d not in all_active_device_ids]
+        # Checkout new device
+        st.subheader("Check Out a Device")
 
-    # Check if user already has devices checked out
-    has_athlete_device = False
-    has_payment_terminal = False
+        # Available devices come straight from the store's availability bitmap
+        available_athlete_devices = get_available_devices("Athlete Device")
+        available_payment_terminals = get_available_devices("Payment Terminal")
 
-    if not athlete_active_devices.empty:
-        for _, device in athlete_active_devices.iterrows():
-            if device['device_type'] == "Athlete Device":
-                has_athlete_device = True
-            elif device['device_type'] == "Payment Terminal":
-                has_payment_terminal = True
+        # Check if user already has devices checked out
+        has_athlete_device = False
+        has_payment_terminal = False
 
-    # Create checkout form - responsive layout
-    if st.session_state.get("is_mobile", False):
-        # Stack vertically on mobile
-        st.markdown("### Athlete Device")
-        if not has_athlete_device and available_athlete_devices:
-            athlete_device_id = st.selectbox(
-                "Select Athlete Device (1-35)", 
-                ["None"] + available_athlete_devices
-            )
-        elif has_athlete_device:
-            st.info("You already have an Athlete Device checked out.")
-            athlete_device_id = "None"
-        else:
-            st.warning("No Athlete Devices available.")
-            athlete_device_id = "None"
-
-        st.markdown("### Payment Terminal")
-        if not has_payment_terminal and available_payment_terminals:
-            payment_terminal_id = st.selectbox(
-                "Select Payment Terminal (36-50)", 
-                ["None"] + available_payment_terminals
-            )
-        elif has_payment_terminal:
-            st.info("You already have a Payment Terminal checked out.")
-            payment_terminal_id = "None"
-        else:
-            st.warning("No Payment Terminals available.")
-            payment_terminal_id = "None"
-    else:
-        # Side by side on desktop
-        col1, col2 = st.columns(2)
+        if not athlete_active_devices.empty:
+            for _, device in athlete_active_devices.iterrows():
+                if device['device_type'] == "Athlete Device":
+                    has_athlete_device = True
+                elif device['device_type'] == "Payment Terminal":
+                    has_payment_terminal = True
 
-        # Athlete Device dropdown
-        with col1:
+        # Create checkout form - responsive layout
+        if st.session_state.get("is_mobile", False):
+            # Stack vertically on mobile
             st.markdown("### Athlete Device")
             if not has_athlete_device and available_athlete_devices:
                 athlete_device_id = st.selectbox(
@@ -237,8 +253,6 @@ def athlete_device_checkout():
                 st.warning("No Athlete Devices available.")
                 athlete_device_id = "None"
 
-        # Payment Terminal dropdown
-        with col2:
             st.markdown("### Payment Terminal")
             if not has_payment_terminal and available_payment_terminals:
                 payment_terminal_id = st.selectbox(
@@ -251,61 +265,89 @@ def athlete_device_checkout():
             else:
                 st.warning("No Payment Terminals available.")
                 payment_terminal_id = "None"
+        else:
+            # Side by side on desktop
+            col1, col2 = st.columns(2)
 
-    # Checkout button
-    if athlete_device_id != "None" or payment_terminal_id != "None":
-        if st.button("Check Out Selected Devices"):
-            if athlete_device_id != "None":
-                # Create new assignment for athlete device
-                new_assignment = pd.DataFrame({
-                    'device_id': [athlete_device_id],
-                    'employee_name': [st.session_state.current_user],
-                    'checkout_time': [datetime.now()],
-                    'checkin_time': [None],
-                    'device_type': ["Athlete Device"]
-                })
-                st.session_state.device_assignments = pd.concat(
-                    [st.session_state.device_assignments, new_assignment], 
-                    ignore_index=True
-                )
-                st.success(f"Successfully checked out Athlete Device #{athlete_device_id}")
-
-            if payment_terminal_id != "None":
-                # Create new assignment for payment terminal
-                new_assignment = pd.DataFrame({
-                    'device_id': [payment_terminal_id],
-                    'employee_name': [st.session_state.current_user],
-                    'checkout_time': [datetime.now()],
-                    'checkin_time': [None],
-                    'device_type': ["Payment Terminal"]
-                })
-                st.session_state.device_assignments = pd.concat(
-                    [st.session_state.device_assignments, new_assignment], 
-                    ignore_index=True
-                )
-                st.success(f"Successfully checked out Payment Terminal #{payment_terminal_id}")
+            # Athlete Device dropdown
+            with col1:
+                st.markdown("### Athlete Device")
+                if not has_athlete_device and available_athlete_devices:
+                    athlete_device_id = st.selectbox(
+                        "Select Athlete Device (1-35)", 
+                        ["None"] + available_athlete_devices
+                    )
+                elif has_athlete_device:
+                    st.info("You already have an Athlete Device checked out.")
+                    athlete_device_id = "None"
+                else:
+                    st.warning("No Athlete Devices available.")
+                    athlete_device_id = "None"
 
-            st.rerun()
+            # Payment Terminal dropdown
+            with col2:
+                st.markdown("### Payment Terminal")
+                if not has_payment_terminal and available_payment_terminals:
+                    payment_terminal_id = st.selectbox(
+                        "Select Payment Terminal (36-50)", 
+                        ["None"] + available_payment_terminals
+                    )
+                elif has_payment_terminal:
+                    st.info("You already have a Payment Terminal checked out.")
+                    payment_terminal_id = "None"
+                else:
+                    st.warning("No Payment Terminals available.")
+                    payment_terminal_id = "None"
+
+        # Checkout button
+        if athlete_device_id != "None" or payment_terminal_id != "None":
+            if st.button("Check Out Selected Devices"):
+                selected = [d for d in [athlete_device_id, payment_terminal_id] if d != "None"]
+                # Both devices are checked out in one transaction against the shared store
+                success, messages = assign_devices(st.session_state.current_user, selected)
+                for message in messages:
+                    if success:
+                        st.success(message)
+                    else:
+                        st.error(message)
+
+                rerun_fragment()
 
 def admin_device_overview():
-    """Admin interface showing device status"""
+    """Admin interface showing device status
+
+    Only the selected view's body runs (st.tabs would run every tab's body
+    on each rerun): switching views reruns the page so the new one shows
+    fresh data. Each view (and each actions panel) is a fragment, so filters,
+    paging and buttons inside it rerun just that part. Returning a device
+    never rebuilds the History or User Management views.
+    """
     st.markdown("## Device Management Dashboard")
 
     # Tabs for different views - hide User Management for specialists
-    if st.session_state.user_role == 'specialist':
-        tab_personal, tab1, tab2 = st.tabs(["My Devices", "Active Checkouts", "History"])
-    else:
-        tab_personal, tab1, tab2, tab3 = st.tabs(["My Devices", "Active Checkouts", "History", "User Management"])
-
-    # Get the admin's full name
-    user_data = st.session_state.users[st.session_state.users['username'] == st.session_state.current_user]
-    if not user_data.empty:
-        full_name = f"{user_data.iloc[0]['first_name']} {user_data.iloc[0]['last_name']}"
-    else:
-        full_name = st.session_state.current_user
+    tab_names = ["My Devices", "Active Checkouts", "History"]
+    tab_bodies = [personal_devices_tab, active_checkouts_tab, history_tab]
+    if st.session_state.user_role == 'coach':
+        tab_names.append("User Management")
+        tab_bodies.append(user_management_tab)
+
+    # A view left over from another role's login would not be an option
+    if st.session_state.get("admin_tabs") not in tab_names:
+        st.session_state.pop("admin_tabs", None)
+    selected_tab = st.radio("View", tab_names, key="admin_tabs", horizontal=True, label_visibility="collapsed")
+    tab_bodies[tab_names.index(selected_tab)]()
+
+@st.fragment
+def personal_devices_tab():
+    """My Devices tab: the signed-in coach's own checkouts (similar to the athlete interface)"""
+    with section("My Devices"):
+        # Get the admin's full name
+        user_data = get_user(st.session_state.current_user)
+        if user_data is not None:
+            full_name = f"{user_data['first_name']} {user_data['last_name']}"
+        else:
+            full_name = st.session_state.current_user
 
-    # Personal device checkout tab - similar to athlete interface
-    with tab_personal:
         st.markdown(f"## Welcome, {full_name}!")
 
         # Get coach/specialist's active checkouts
@@ -325,21 +367,14 @@ def admin_device_overview():
                     if st.button(f"Return Device {row['device_id']}"):
                         if return_device(row['device_id']):
                             st.success(f"Successfully returned {row['device_id']}")
-                            st.rerun()
+                            rerun_fragment()
 
         # Checkout new device
         st.subheader("Check Out a Device")
 
-        # Generate device lists
-        athlete_devices = [str(i) for i in range(1, 36)]
-        payment_terminals = [str(i) for i in range(36, 51)]
-
-        # Get all currently checked out devices
-        all_active_device_ids = active_devices['device_id'].tolist()
-
-        # Filter available devices (remove ones already checked out)
-        available_athlete_devices = [d for d in athlete_devices if d not in all_active_device_ids]
-        available_payment_terminals = [d for d in payment_terminals if d not in all_active_device_ids]
+        # Available devices come straight from the store's availability bitmap
+        available_athlete_devices = get_available_devices("Athlete Device")
+        available_payment_terminals = get_available_devices("Payment Terminal")
 
         # Check if user already has devices checked out
         has_athlete_device = False
@@ -421,43 +456,26 @@ def admin_device_overview():
         # Checkout button
         if athlete_device_id != "None" or payment_terminal_id != "None":
             if st.button("Check Out Selected Devices", key="personal_checkout_button"):
-                if athlete_device_id != "None":
-                    # Create new assignment for athlete device
-                    new_assignment = pd.DataFrame({
-                        'device_id': [athlete_device_id],
-                        'employee_name': [st.session_state.current_user],
-                        'checkout_time': [datetime.now()],
-                        'checkin_time': [None],
-                        'device_type': ["Athlete Device"]
-                    })
-                    st.session_state.device_assignments = pd.concat(
-                        [st.session_state.device_assignments, new_assignment],
-                        ignore_index=True
-                    )
-                    st.success(f"Successfully checked out Athlete Device #{athlete_device_id}")
-
-                if payment_terminal_id != "None":
-                    # Create new assignment for payment terminal
-                    new_assignment = pd.DataFrame({
-                        'device_id': [payment_terminal_id],
-                        'employee_name': [st.session_state.current_user],
-                        'checkout_time': [datetime.now()],
-                        'checkin_time': [None],
-                        'device_type': ["Payment Terminal"]
-                    })
-                    st.session_state.device_assignments = pd.concat(
-                        [st.session_state.device_assignments, new_assignment],
-                        ignore_index=True
-                    )
-                    st.success(f"Successfully checked out Payment Terminal #{payment_terminal_id}")
-
-                st.rerun()
+                selected = [d for d in [athlete_device_id, payment_terminal_id] if d != "None"]
+                # Both devices are checked out in one transaction against the shared store
+                success, messages = assign_devices(st.session_state.current_user, selected)
+                for message in messages:
+                    if success:
+                        st.success(message)
+                    else:
+                        st.error(message)
 
-    # This section has been removed (Athlete Checkout tab)
+                rerun_fragment()
 
-    with tab1:
+@st.fragment
+def active_checkouts_tab():
+    """Active Checkouts tab: the devices that are out, plus the device actions"""
+    with section("Active Checkouts"):
         st.subheader("Active Devices")
 
+        # Get active assignments, with names already joined (shared across sessions until the next change)
+        active_devices = get_active_assignments_with_names()
+
         # Filter controls
         col1, col2, col3, col4 = st.columns(4)
         with col1:
@@ -465,21 +483,11 @@ def admin_device_overview():
             active_device_ids = ['All'] + sorted(active_devices['device_id'].unique().tolist())
             filter_device_id = st.selectbox("Filter by Device ID", active_device_ids)
         with col2:
-            device_types = ['All'] + list(st.session_state.device_assignments['device_type'].unique())
+            device_types = ['All'] + get_assignment_values('device_type')
             filter_device_type = st.selectbox("Filter by Device Type", device_types)
         with col3:
-            # Create athlete list with names for better identification
-            athlete_usernames = ['All'] + list(st.session_state.device_assignments['employee_name'].unique())
-            athlete_options = ['All']
-
-            # Add formatted options with names for all usernames except 'All'
-            for username in athlete_usernames:
-                if username != 'All':
-                    user_data = st.session_state.users[st.session_state.users['username'] == username]
-                    if not user_data.empty:
-                        first_name = user_data.iloc[0]['first_name']
-                        last_name = user_data.iloc[0]['last_name']
-                        athlete_options.append(f"{username} - {first_name} {last_name}")
+            # Athlete list with names for better identification
+            athlete_options = ['All'] + get_athlete_options()
 
             filter_athlete = st.selectbox("Filter by Athlete", athlete_options)
             # Extract username from the selection for filtering
@@ -488,9 +496,6 @@ def admin_device_overview():
             else:
                 filter_athlete_username = 'All'
 
-        # Get active assignments
-        active_devices = get_active_assignments()
-
         if not active_devices.empty:
             # Apply filters
             if filter_device_id != 'All':
@@ -500,179 +505,192 @@ def admin_device_overview():
             if filter_athlete_username != 'All':
                 active_devices = active_devices[active_devices['employee_name'] == filter_athlete_username]
 
-            # Format for display
-            display_df = active_devices.copy()
-            display_df['checkout_time'] = display_df['checkout_time'].apply(
-                lambda x: x.strftime("%Y-%m-%d %H:%M:%S") if pd.notna(x) else ""
-            )
-
-            # Add first and last name columns by looking up user data
-            display_df['First Name'] = ""
-            display_df['Last Name'] = ""
-
-            # Populate first and last names for each row
-            for idx, row in display_df.iterrows():
-                user_data = st.session_state.users[st.session_state.users['username'] == row['employee_name']]
-                if not user_data.empty:
-                    display_df.at[idx, 'First Name'] = user_data.iloc[0]['first_name']
-                    display_df.at[idx, 'Last Name'] = user_data.iloc[0]['last_name']
-
-            display_df = display_df.rename(columns={
+            # checkout_time stays datetime64 and is formatted by the column config
+            display_df = active_devices.rename(columns={
                 'device_id': 'Device ID',
                 'employee_name': 'Employee ID',
                 'checkout_time': 'Checkout Time',
                 'device_type': 'Device Type'
             })
 
-            st.dataframe(display_df[['Device ID', 'Device Type', 'Employee ID', 'First Name', 'Last Name', 'Checkout Time']], use_container_width=True)
+            st.dataframe(
+                display_df[['Device ID', 'Device Type', 'Employee ID', 'First Name', 'Last Name', 'Checkout Time']],
+                column_config={
+                    "Checkout Time": st.column_config.DatetimeColumn(format=DATETIME_COLUMN_FORMAT)
+                },
+                use_container_width=True
+            )
+        else:
+            st.info("No devices are currently checked out.")
 
-            # Add collapsible section for device management actions
-            with st.expander("Device Management Actions"):
-                management_tabs = st.tabs(["Assign Device", "Return Device"])
+        device_actions_panel()
 
-                # Tab for assigning devices to others
-                with management_tabs[0]:
-                    # Get all users from the system
-                    all_users = st.session_state.users.copy()
-                    user_options = [f"{row['username']} - {row['first_name']} {row['last_name']}" for _, row in all_users.iterrows()]
+@st.fragment
+def device_actions_panel():
+    """Assign, return and bulk actions for any user's devices
 
-                    # Generate device lists
-                    athlete_devices = [str(i) for i in range(1, 36)]
-                    payment_terminals = [str(i) for i in range(36, 51)]
+    A fragment of its own, so choosing users and devices here does not
+    redraw the table above; an action reruns the page to refresh it.
+    """
+    active_devices = get_active_assignments()
 
-                    # Get all currently checked out devices
-                    all_active_device_ids = active_devices['device_id'].tolist()
+    # Add collapsible section for device management actions (also shown
+    # when nothing is checked out, e.g. at shift start)
+    with st.expander("Device Management Actions"):
+        management_tabs = st.tabs(["Assign Device", "Return Device", "Bulk Checkout", "Bulk Return"])
 
-                    # Filter available devices (remove ones already checked out)
-                    available_athlete_devices = [d for d in athlete_devices if d not in all_active_device_ids]
-                    available_payment_terminals = [d for d in payment_terminals if d not in all_active_device_ids]
+        # Tab for assigning devices to others
+        with management_tabs[0]:
+            # Get all users from the system
+            user_options = get_user_options()
 
-                    # Create assign form
-                    col1, col2, col3 = st.columns(3)
+            # Available devices come straight from the store's availability bitmap
+            available_athlete_devices = get_available_devices("Athlete Device")
+            available_payment_terminals = get_available_devices("Payment Terminal")
 
-                    with col1:
-                        selected_user = st.selectbox("Select User", user_options, key="assign_user_select")
-                        # Extract username from selection
-                        selected_username = selected_user.split(" - ")[0] if selected_user else ""
+            # Create assign form
+            col1, col2, col3 = st.columns(3)
 
-                    with col2:
-                        device_type = st.selectbox("Device Type", ["Athlete Device", "Payment Terminal"], key="assign_device_type")
+            with col1:
+                selected_user = st.selectbox("Select User", user_options, key="assign_user_select")
+                # Extract username from selection
+                selected_username = selected_user.split(" - ")[0] if selected_user else ""
 
-                        if device_type == "Athlete Device":
-                            if available_athlete_devices:
-                                device_id = st.selectbox("Select Device", available_athlete_devices, key="assign_athlete_device")
-                            else:
-                                st.warning("No Athlete Devices available")
-                                device_id = None
-                        else:
-                            if available_payment_terminals:
-                                device_id = st.selectbox("Select Device", available_payment_terminals, key="assign_payment_terminal")
-                            else:
-                                st.warning("No Payment Terminals available")
-                                device_id = None
-
-                    with col3:
-                        st.write("")  # Space for alignment
-                        st.write("")  # Space for alignment
-                        if st.button("Assign Device") and device_id and selected_username:
-                            # Create new assignment
-                            new_assignment = pd.DataFrame({
-                                'device_id': [device_id],
-                                'employee_name': [selected_username],
-                                'checkout_time': [datetime.now()],
-                                'checkin_time': [None],
-                                'device_type': [device_type]
-                            })
-
-                            st.session_state.device_assignments = pd.concat(
-                                [st.session_state.device_assignments, new_assignment],
-                                ignore_index=True
-                            )
-
-                            st.success(f"Successfully assigned {device_type} #{device_id} to {selected_username}")
-                            st.rerun()
+            with col2:
+                device_type = st.selectbox("Device Type", ["Athlete Device", "Payment Terminal"], key="assign_device_type")
 
-                # Tab for forcing return of devices
-                with management_tabs[1]:
-                    if active_devices.empty:
-                        st.info("No devices currently checked out to return.")
+                if device_type == "Athlete Device":
+                    if available_athlete_devices:
+                        device_id = st.selectbox("Select Device", available_athlete_devices, key="assign_athlete_device")
                     else:
-                        col1, col2 = st.columns([3, 1])
-                        with col1:
-                            return_device_id = st.selectbox("Select Device to Return", active_devices['device_id'].tolist())
-                        with col2:
-                            st.write("")  # Space for alignment
-                            if st.button("Return Device"):
-                                if return_device(return_device_id):
-                                    st.success(f"Successfully returned {return_device_id}")
-                                    st.rerun()
-        else:
-            st.info("No devices are currently checked out.")
+                        st.warning("No Athlete Devices available")
+                        device_id = None
+                else:
+                    if available_payment_terminals:
+                        device_id = st.selectbox("Select Device", available_payment_terminals, key="assign_payment_terminal")
+                    else:
+                        st.warning("No Payment Terminals available")
+                        device_id = None
 
-    with tab2:
-        st.subheader("Device Checkout History")
+            with col3:
+                st.write("")  # Space for alignment
+                st.write("")  # Space for alignment
+                if st.button("Assign Device") and device_id and selected_username:
+                    success, message = assign_device(selected_username, device_id)
+                    if success:
+                        st.success(f"Successfully assigned {device_type} #{device_id} to {selected_username}")
+                        st.rerun()
+                    else:
+                        st.error(message)
+
+        # Tab for forcing return of devices
+        with management_tabs[1]:
+            if active_devices.empty:
+                st.info("No devices currently checked out to return.")
+            else:
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    return_device_id = st.selectbox("Select Device to Return", active_devices['device_id'].tolist())
+                with col2:
+                    st.write("")  # Space for alignment
+                    if st.button("Return Device"):
+                        if return_device(return_device_id):
+                            st.success(f"Successfully returned {return_device_id}")
+                            st.rerun()
+
+        # Tab for checking out a whole shift's devices at once
+        with management_tabs[2]:
+            st.write("Paste one Employee ID and Device ID per line (for example `000002, 12`), "
+                     "or upload a CSV with those two columns.")
+            pairs_text = st.text_area("Employee ID, Device ID", key="bulk_checkout_text", height=200)
+            pairs_file = st.file_uploader("Or upload a CSV file", type=["csv"], key="bulk_checkout_file")
+            if st.button("Check Out All", key="bulk_checkout_button"):
+                if pairs_file is not None:
+                    pairs_text = pairs_file.getvalue().decode("utf-8-sig")
+                st.session_state.bulk_report = bulk_assign_devices(pairs_text)
+                st.rerun()
 
-        # Get all history data before defining filters
-        history = get_device_history()
+        # Tab for returning every device held by the closing shift
+        with management_tabs[3]:
+            held = get_active_assignments()
+            if held.empty:
+                st.info("No devices currently checked out to return.")
+            else:
+                holder_options = []
+                for username in held['employee_name'].drop_duplicates().tolist():
+                    user_data = get_user(username)
+                    if user_data is not None:
+                        holder_options.append(f"{username} - {user_data['first_name']} {user_data['last_name']}")
+                    else:
+                        holder_options.append(username)
+                closing_shift = st.multiselect("Athletes going off shift", holder_options,
+                                               default=holder_options, key="bulk_return_holders")
+                closing_usernames = [option.split(" - ")[0] for option in closing_shift]
+                closing_devices = held[held['employee_name'].isin(closing_usernames)]['device_id'].tolist()
+                st.write(f"{len(closing_devices)} device(s) will be returned")
+                if st.button("Return All Selected", key="bulk_return_button") and closing_devices:
+                    st.session_state.bulk_report = bulk_return_devices(closing_devices)
+                    st.rerun()
+
+        # Result of the last bulk action, kept across the rerun that refreshes the tables
+        if st.session_state.get("bulk_report") is not None:
+            bulk_success, bulk_report = st.session_state.bulk_report
+            if bulk_success:
+                st.success(f"Bulk action completed for {len(bulk_report)} device(s)")
+            else:
+                st.error("Nothing was changed. Fix the rows marked below and try again.")
+            st.dataframe(bulk_report, hide_index=True, use_container_width=True)
+            if st.button("Clear Report", key="clear_bulk_report"):
+                st.session_state.bulk_report = None
+                rerun_fragment()
+
+@st.fragment
+def history_tab():
+    """History tab: filtered, paged checkout history"""
+    with section("History"):
+        st.subheader("Device Checkout History")
 
         # First expander for basic filters
         with st.expander("Basic Filters", expanded=False):
             # Responsive layout for filters - stack vertically on mobile
             if st.session_state.get("is_mobile", False):
                 # Get list of all device IDs in system (1-50)
-                all_device_ids = ['All'] + [str(i) for i in range(1, 51)]
+                all_device_ids = ['All'] + list(range(1, 51))
                 history_filter_device_id = st.selectbox("Filter History by Device ID", all_device_ids)
-                history_device_types = ['All'] + list(st.session_state.device_assignments['device_type'].unique())
-                history_filter_device_type = st.selectbox("Filter History by Device Type", history_device_types)
-                # Create athlete list with names for better identification
-                athlete_usernames = ['All'] + list(st.session_state.device_assignments['employee_name'].unique())
-                history_athlete_options = ['All']
-
-                # Add formatted options with names for all usernames except 'All'
-                for username in athlete_usernames:
-                    if username != 'All':
-                        user_data = st.session_state.users[st.session_state.users['username'] == username]
-                        if not user_data.empty:
-                            first_name = user_data.iloc[0]['first_name']
-                            last_name = user_data.iloc[0]['last_name']
-                            history_athlete_options.append(f"{username} - {first_name} {last_name}")
-
-                history_filter_athlete = st.selectbox("Filter History by Athlete", history_athlete_options)
-                # Extract username from the selection for filtering
-                if history_filter_athlete != 'All':
-                    history_filter_athlete_username = history_filter_athlete.split(" - ")[0]
-                else:
-                    history_filter_athlete_username = 'All'
+                history_type_counts = get_assignment_counts('device_type')
+                history_filter_device_type = facet_selectbox(
+                    "Filter History by Device Type", history_type_counts, count_labels(history_type_counts),
+                    "history_device_type_filter"
+                )
+                # Athletes by username, labelled with names and number of checkouts
+                history_athlete_labels = get_athlete_labels()
+                history_filter_athlete_username = facet_selectbox(
+                    "Filter History by Athlete", history_athlete_labels, history_athlete_labels,
+                    "history_athlete_filter"
+                )
             else:
                 # Desktop layout
                 col1, col2, col3 = st.columns(3)
                 with col1:
                     # Get list of all device IDs in history
-                    history_device_ids = ['All'] + sorted(history['device_id'].unique().tolist())
-                    history_filter_device_id = st.selectbox("Filter History by Device ID", history_device_ids)
+                    history_device_counts = get_assignment_counts('device_id')
+                    history_filter_device_id = facet_selectbox(
+                        "Filter History by Device ID", sorted(history_device_counts),
+                        count_labels(history_device_counts), "history_device_id_filter"
+                    )
                 with col2:
-                    history_device_types = ['All'] + list(st.session_state.device_assignments['device_type'].unique())
-                    history_filter_device_type = st.selectbox("Filter History by Device Type", history_device_types)
+                    history_type_counts = get_assignment_counts('device_type')
+                    history_filter_device_type = facet_selectbox(
+                        "Filter History by Device Type", history_type_counts, count_labels(history_type_counts),
+                        "history_device_type_filter"
+                    )
                 with col3:
-                    # Create athlete list with names for better identification
-                    athlete_usernames = ['All'] + list(st.session_state.device_assignments['employee_name'].unique())
-                    history_athlete_options = ['All']
-
-                    # Add formatted options with names for all usernames except 'All'
-                    for username in athlete_usernames:
-                        if username != 'All':
-                            user_data = st.session_state.users[st.session_state.users['username'] == username]
-                            if not user_data.empty:
-                                first_name = user_data.iloc[0]['first_name']
-                                last_name = user_data.iloc[0]['last_name']
-                                history_athlete_options.append(f"{username} - {first_name} {last_name}")
-
-                    history_filter_athlete = st.selectbox("Filter History by Athlete", history_athlete_options)
-                    # Extract username from the selection for filtering
-                    if history_filter_athlete != 'All':
-                        history_filter_athlete_username = history_filter_athlete.split(" - ")[0]
-                    else:
-                        history_filter_athlete_username = 'All'
+                    # Athletes by username, labelled with names and number of checkouts
+                    history_athlete_labels = get_athlete_labels()
+                    history_filter_athlete_username = facet_selectbox(
+                        "Filter History by Athlete", history_athlete_labels, history_athlete_labels,
+                        "history_athlete_filter"
+                    )
 
         # Separate expander for date filters
         with st.expander("Date Range Filters", expanded=False):
@@ -696,252 +714,248 @@ def admin_device_overview():
                 with end_time_cols[1]:
                     end_minute = st.number_input("Minute", min_value=0, max_value=59, value=59, step=1)
 
-        # Get all history
+        # Apply date and time filters if selected
+        start_datetime = None
+        if start_date:
+            # Create a datetime with the specified date and time
+            start_datetime = pd.Timestamp(
+                year=start_date.year,
+                month=start_date.month,
+                day=start_date.day,
+                hour=start_hour,
+                minute=start_minute
+            )
 
+        end_datetime = None
+        if end_date:
+            # Create a datetime with the specified date and time
+            end_datetime = pd.Timestamp(
+                year=end_date.year,
+                month=end_date.month,
+                day=end_date.day,
+                hour=end_hour,
+                minute=end_minute
+            )
 
-        if not history.empty:
-            # Apply filters
-            if history_filter_device_id != 'All':
-                history = history[history['device_id'] == history_filter_device_id]
-            if history_filter_device_type != 'All':
-                history = history[history['device_type'] == history_filter_device_type]
-            if history_filter_athlete_username != 'All':
-                history = history[history['employee_name'] == history_filter_athlete_username]
-
-            # Apply date and time filters if selected
-            if start_date:
-                # Create a datetime with the specified date and time
-                start_datetime = pd.Timestamp(
-                    year=start_date.year,
-                    month=start_date.month,
-                    day=start_date.day,
-                    hour=start_hour,
-                    minute=start_minute
-                )
-                history = history[history['checkout_time'] >= start_datetime]
-
-            if end_date:
-                # Create a datetime with the specified date and time
-                end_datetime = pd.Timestamp(
-                    year=end_date.year,
-                    month=end_date.month,
-                    day=end_date.day,
-                    hour=end_hour,
-                    minute=end_minute
-                )
-                history = history[history['checkout_time'] <= end_datetime]
+        # Let the store apply the filters (indexed queries on the SQLite engine)
+        history_filters = {
+            'device_id': None if history_filter_device_id == 'All' else history_filter_device_id,
+            'device_type': None if history_filter_device_type == 'All' else history_filter_device_type,
+            'employee_name': None if history_filter_athlete_username == 'All' else history_filter_athlete_username,
+            'start': start_datetime,
+            'end': end_datetime
+        }
 
-            # Format for display
-            display_history = history.copy()
-            display_history['checkout_time'] = display_history['checkout_time'].apply(
-                lambda x: x.strftime("%Y-%m-%d %H:%M:%S") if pd.notna(x) else ""
-            )
-            display_history['checkin_time'] = display_history['checkin_time'].apply(
-                lambda x: x.strftime("%Y-%m-%d %H:%M:%S") if pd.notna(x) else "Not returned"
-            )
+        page_size = st.selectbox("Rows per page", HISTORY_PAGE_SIZES, index=1, key="history_page_size")
 
-            # Add first and last name columns by looking up user data
-            display_history['First Name'] = ""
-            display_history['Last Name'] = ""
+        # Go back to the first page whenever the filters or the page size change
+        history_filter_key = (tuple(history_filters.items()), page_size)
+        if st.session_state.get('history_filter_key') != history_filter_key:
+            st.session_state.history_filter_key = history_filter_key
+            st.session_state.history_cursors = [None]
+        history_cursors = st.session_state.history_cursors
 
-            # Populate first and last names for each row
-            for idx, row in display_history.iterrows():
-                user_data = st.session_state.users[st.session_state.users['username'] == row['employee_name']]
-                if not user_data.empty:
-                    display_history.at[idx, 'First Name'] = user_data.iloc[0]['first_name']
-                    display_history.at[idx, 'Last Name'] = user_data.iloc[0]['last_name']
+        # Only the visible page is loaded, formatted and sent to the browser; the
+        # formatted page is shared by every manager until the store changes
+        history_total, display_history, next_cursor = get_history_page_display(
+            page_size, cursor=history_cursors[-1], **history_filters
+        )
 
-            display_history = display_history.rename(columns={
-                'device_id': 'Device ID',
-                'employee_name': 'Employee ID',
-                'checkout_time': 'Checkout Time',
-                'checkin_time': 'Check-in Time',
-                'device_type': 'Device Type'
-            })
+        if not display_history.empty:
+            first_row = (len(history_cursors) - 1) * page_size + 1
+            st.caption(f"Showing {first_row:,}-{first_row + len(display_history) - 1:,} of {history_total:,} records")
 
             st.dataframe(
-                display_history[['Device ID', 'Device Type', 'Employee ID', 'First Name', 'Last Name', 'Checkout Time', 'Check-in Time']],
+                display_history,
+                hide_index=True,
                 use_container_width=True
             )
+
+            # Cursor-based paging: keep the cursor of every page visited so far
+            col_prev, col_next = st.columns(2)
+            with col_prev:
+                if st.button("Previous Page", key="history_prev_page", disabled=len(history_cursors) == 1):
+                    history_cursors.pop()
+                    rerun_fragment()
+            with col_next:
+                if st.button("Next Page", key="history_next_page", disabled=next_cursor is None):
+                    history_cursors.append(next_cursor)
+                    rerun_fragment()
         else:
             st.info("No device history available.")
 
-    # Only run the User Management tab code if user is an admin and tab3 exists
-    if st.session_state.user_role == 'coach' and 'tab3' in locals():
-        with tab3:
-            st.subheader("User Management Dashboard")
+@st.fragment
+def user_management_tab():
+    """User Management tab (coaches only): the roster table and user actions"""
+    with section("User Management"):
+        st.subheader("User Management Dashboard")
+
+        # Copy the users DataFrame to avoid modifying the original during display
+        users_df = get_users().copy()
+
+        # Show users table first (most important)
+        st.write("Current Users")
+        # Convert passwords to masked display for security
+        users_df['password_display'] = '********'
+
+        # Create an editable dataframe (rows are added and removed with the actions below)
+        st.data_editor(
+            users_df[['username', 'first_name', 'last_name', 'password_display', 'role']],
+            column_config={
+                "username": "Employee ID",
+                "first_name": "First Name",
+                "last_name": "Last Name",
+                "password_display": st.column_config.TextColumn(
+                    "Password",
+                    help="Passwords are stored securely and not displayed in plain text",
+                    disabled=True
+                ),
+                "role": st.column_config.SelectboxColumn(
+                    "Role",
+                    options=["coach", "athlete", "specialist"],
+                    help="User role determines access level"
+                )
+            },
+            disabled=["username"],
+            hide_index=True,
+            num_rows="fixed",
+            key="user_table"
+        )
+
+        # Save changes button
+        if st.button("Save User Changes", key="save_user_changes"):
+            # Only the edited cells, keyed by the username of the row they belong to
+            edited_rows = st.session_state["user_table"].get("edited_rows", {})
+            usernames = users_df['username'].tolist()
+            changes = {}
+            for position, fields in edited_rows.items():
+                changes[usernames[int(position)]] = fields
+
+            errors, changes = validate_user_changes(changes)
+            if errors:
+                for error in errors:
+                    st.error(error)
+            elif not changes:
+                st.info("No changes to save.")
+            else:
+                # Apply to the shared roster and save only the edited fields
+                update_users(changes)
+                st.success(f"User information updated successfully! ({len(changes)} user(s) changed)")
+
+        user_actions_panel()
+
+@st.fragment
+def user_actions_panel():
+    """Add user, reset password and remove user forms"""
+    # User action tabs in an expander to keep them hidden until needed
+    with st.expander("User Management Actions"):
+        user_actions = st.tabs(["Add User", "Reset Password", "Remove User"])
+
+        # Tab 1: Add new user
+        with user_actions[0]:
+            with st.form("add_user_form"):
+                # Use a form counter to reset the form
+                if 'add_user_form_counter' not in st.session_state:
+                    st.session_state.add_user_form_counter = 0
+
+                # Generate unique keys for each input field
+                form_id = st.session_state.add_user_form_counter
+
+                new_username = st.text_input("Employee ID", max_chars=6, key=f"username_{form_id}")
+
+                # Validate that input is numeric and max 6 digits
+                if new_username and (not new_username.isdigit() or len(new_username) > 6):
+                    st.error("Employee ID must be numeric and maximum 6 digits")
+
+                new_first_name = st.text_input("First Name", key=f"first_name_{form_id}")
+                new_last_name = st.text_input("Last Name", key=f"last_name_{form_id}")
+                new_password = st.text_input("Password", type="password", key=f"password_{form_id}")
+                confirm_password = st.text_input("Confirm Password", type="password", key=f"confirm_password_{form_id}")
+                new_role = st.selectbox("Role", ["athlete", "coach", "specialist"])
+
+                submit_button = st.form_submit_button("Add User")
+
+                if submit_button:
+                    if not new_username or not new_password:
+                        st.error("Employee ID and password are required.")
+                    elif new_password != confirm_password:
+                        st.error("Passwords do not match.")
+                    elif not add_user(new_username, new_password, new_role, new_first_name, new_last_name):
+                        st.error("Employee ID already exists.")
+                    else:
+                        st.success(f"Added new user: {new_username}")
 
-            # Copy the users DataFrame to avoid modifying the original during display
-            users_df = st.session_state.users.copy()
+                        # Increment the form counter to generate new form keys on next render
+                        st.session_state.add_user_form_counter += 1
 
-            # Show users table first (most important)
-            st.write("Current Users")
-            # Convert passwords to masked display for security
-            users_df['password_display'] = '********'
+                        # Using session state to control rerun
+                        st.session_state.user_added = True
+                        st.rerun()
 
-            # Create an editable dataframe
-            edited_df = st.data_editor(
-                users_df[['username', 'first_name', 'last_name', 'password_display', 'role']],
-                column_config={
-                    "username": "Employee ID",
-                    "first_name": "First Name",
-                    "last_name": "Last Name",
-                    "password_display": st.column_config.TextColumn(
-                        "Password",
-                        help="Passwords are stored securely and not displayed in plain text",
-                        disabled=True
-                    ),
-                    "role": st.column_config.SelectboxColumn(
-                        "Role",
-                        options=["coach", "athlete", "specialist"],
-                        help="User role determines access level"
-                    )
-                },
-                hide_index=True,
-                num_rows="dynamic",
-                key="user_table"
-            )
+        # Tab 2: Reset password
+        with user_actions[1]:
+            # Use a form counter to reset the password form
+            if 'reset_pwd_form_counter' not in st.session_state:
+                st.session_state.reset_pwd_form_counter = 0
+
+            with st.form("reset_password_form"):
+                # Generate unique keys for each input field
+                pwd_form_id = st.session_state.reset_pwd_form_counter
+
+                username_to_reset = st.text_input("Employee ID", max_chars=6, key=f"username_reset_{pwd_form_id}")
+                new_pwd = st.text_input("New Password", type="password", key=f"new_pwd_{pwd_form_id}")
+                confirm_pwd = st.text_input("Confirm New Password", type="password", key=f"confirm_pwd_{pwd_form_id}")
+
+                reset_button = st.form_submit_button("Reset Password")
+
+                if reset_button:
+                    if not username_to_reset:
+                        st.error("Employee ID cannot be empty")
+                    elif not new_pwd:
+                        st.error("Password cannot be empty")
+                    elif new_pwd != confirm_pwd:
+                        st.error("Passwords do not match")
+                    else:
+                        # Find user and update password
+                        if reset_password(username_to_reset, new_pwd):
+                            st.success(f"Password reset for {username_to_reset}")
 
-            # Save changes button
-            if st.button("Save User Changes", key="save_user_changes"):
-                # Update first_name, last_name and role (but not password)
-                for index, row in edited_df.iterrows():
-                    if index < len(st.session_state.users):
-                        st.session_state.users.loc[index, 'first_name'] = row['first_name']
-                        st.session_state.users.loc[index, 'last_name'] = row['last_name']
-                        st.session_state.users.loc[index, 'role'] = row['role']
-                
-                # Save users to file for persistence
-                st.session_state.users.to_csv('users.csv', index=False)
-                st.success("User information updated successfully!")
-
-            # User action tabs in an expander to keep them hidden until needed
-            with st.expander("User Management Actions"):
-                user_actions = st.tabs(["Add User", "Reset Password", "Remove User"])
-
-                # Tab 1: Add new user
-                with user_actions[0]:
-                    with st.form("add_user_form"):
-                        # Use a form counter to reset the form
-                        if 'add_user_form_counter' not in st.session_state:
-                            st.session_state.add_user_form_counter = 0
-
-                        # Generate unique keys for each input field
-                        form_id = st.session_state.add_user_form_counter
-
-                        new_username = st.text_input("Employee ID", max_chars=6, key=f"username_{form_id}")
-
-                        # Validate that input is numeric and max 6 digits
-                        if new_username and (not new_username.isdigit() or len(new_username) > 6):
-                            st.error("Employee ID must be numeric and maximum 6 digits")
-
-                        new_first_name = st.text_input("First Name", key=f"first_name_{form_id}")
-                        new_last_name = st.text_input("Last Name", key=f"last_name_{form_id}")
-                        new_password = st.text_input("Password", type="password", key=f"password_{form_id}")
-                        confirm_password = st.text_input("Confirm Password", type="password", key=f"confirm_password_{form_id}")
-                        new_role = st.selectbox("Role", ["athlete", "coach", "specialist"])
-
-                        submit_button = st.form_submit_button("Add User")
-
-                        if submit_button:
-                            if not new_username or not new_password:
-                                st.error("Employee ID and password are required.")
-                            elif new_password != confirm_password:
-                                st.error("Passwords do not match.")
-                            elif new_username in st.session_state.users['username'].values:
-                                st.error("Employee ID already exists.")
-                            else:
-                                # Add new user
-                                new_user = pd.DataFrame({
-                                    'username': [new_username],
-                                    'password': [hash_password(new_password)],
-                                    'role': [new_role],
-                                    'first_name': [new_first_name],
-                                    'last_name': [new_last_name]
-                                })
-
-                                st.session_state.users = pd.concat([st.session_state.users, new_user], ignore_index=True)
-                                # Save users to file for persistence
-                                st.session_state.users.to_csv('users.csv', index=False)
-                                st.success(f"Added new user: {new_username}")
-
-                                # Increment the form counter to generate new form keys on next render
-                                st.session_state.add_user_form_counter += 1
-
-                                # Using session state to control rerun
-                                st.session_state.user_added = True
-                                st.rerun()
-
-                # Tab 2: Reset password
-                with user_actions[1]:
-                    # Use a form counter to reset the password form
-                    if 'reset_pwd_form_counter' not in st.session_state:
-                        st.session_state.reset_pwd_form_counter = 0
-
-                    with st.form("reset_password_form"):
-                        # Generate unique keys for each input field
-                        pwd_form_id = st.session_state.reset_pwd_form_counter
-
-                        username_to_reset = st.text_input("Employee ID", max_chars=6, key=f"username_reset_{pwd_form_id}")
-                        new_pwd = st.text_input("New Password", type="password", key=f"new_pwd_{pwd_form_id}")
-                        confirm_pwd = st.text_input("Confirm New Password", type="password", key=f"confirm_pwd_{pwd_form_id}")
-
-                        reset_button = st.form_submit_button("Reset Password")
-
-                        if reset_button:
-                            if not username_to_reset:
-                                st.error("Employee ID cannot be empty")
-                            elif not new_pwd:
-                                st.error("Password cannot be empty")
-                            elif new_pwd != confirm_pwd:
-                                st.error("Passwords do not match")
-                            else:
-                                # Find user and update password
-                                user_idx = st.session_state.users.index[st.session_state.users['username'] == username_to_reset].tolist()
-                                if user_idx:
-                                    st.session_state.users.loc[user_idx[0], 'password'] = hash_password(new_pwd)
-                                    # Save users to file for persistence
-                                    st.session_state.users.to_csv('users.csv', index=False)
-                                    st.success(f"Password reset for {username_to_reset}")
-
-                                    # Increment the form counter to generate new form keys on next render
-                                    st.session_state.reset_pwd_form_counter += 1
-
-                                    # Using session state to control rerun
-                                    st.session_state.password_reset = True
-                                    st.rerun()
-                                else:
-                                    st.error(f"Employee ID {username_to_reset} not found.")
-
-                # Tab 3: Remove employee
-                with user_actions[2]:
-                    col_input, col_button = st.columns([3, 1])
-
-                    with col_input:
-                        employee_to_remove = st.text_input("Employee ID For Removal", max_chars=6, key="employee_to_remove")
-
-                    with col_button:
-                        # Add some vertical space to align with the text input
-                        st.write("")
-                        st.write("")
-                        if st.button("Remove Employee", key="remove_employee"):
-                            if not employee_to_remove:
-                                st.error("Please enter an Employee ID to remove.")
-                            elif employee_to_remove not in st.session_state.users['username'].values:
-                                st.error(f"Employee ID {employee_to_remove} not found.")
-                            elif employee_to_remove == '000001':
-                                st.error("Cannot remove the main administrator account.")
-                            else:
-                                # Get user info before removing
-                                user_to_remove = st.session_state.users[st.session_state.users['username'] == employee_to_remove].iloc[0]
-                                employee_name = f"{user_to_remove['first_name']} {user_to_remove['last_name']}"
-
-                                # Remove the user
-                                st.session_state.users = st.session_state.users[st.session_state.users['username'] != employee_to_remove]
-                                # Save users to file for persistence
-                                st.session_state.users.to_csv('users.csv', index=False)
-                                st.success(f"Employee {employee_name} (ID: {employee_to_remove}) removed successfully!")
-                                st.rerun()
+                            # Increment the form counter to generate new form keys on next render
+                            st.session_state.reset_pwd_form_counter += 1
+
+                            # Using session state to control rerun
+                            st.session_state.password_reset = True
+                            rerun_fragment()
+                        else:
+                            st.error(f"Employee ID {username_to_reset} not found.")
+
+        # Tab 3: Remove employee
+        with user_actions[2]:
+            col_input, col_button = st.columns([3, 1])
+
+            with col_input:
+                employee_to_remove = st.text_input("Employee ID For Removal", max_chars=6, key="employee_to_remove")
+
+            with col_button:
+                # Add some vertical space to align with the text input
+                st.write("")
+                st.write("")
+                if st.button("Remove Employee", key="remove_employee"):
+                    if not employee_to_remove:
+                        st.error("Please enter an Employee ID to remove.")
+                    elif get_user(employee_to_remove) is None:
+                        st.error(f"Employee ID {employee_to_remove} not found.")
+                    elif employee_to_remove == '000001':
+                        st.error("Cannot remove the main administrator account.")
+                    else:
+                        # Get user info before removing
+                        user_to_remove = get_user(employee_to_remove)
+                        employee_name = f"{user_to_remove['first_name']} {user_to_remove['last_name']}"
+
+                        # Remove the user
+                        remove_user(employee_to_remove)
+                        st.success(f"Employee {employee_name} (ID: {employee_to_remove}) removed successfully!")
+                        st.rerun()
 
 def login_page():
     """Login page UI"""
@@ -1021,9 +1035,6 @@ def login_page():
                 st.error("Please enter both username and password")
                 return
 
-            # Check credentials
-            hashed_pwd = hash_password(password)
-            
             # Ensure username is treated as string to preserve leading zeros
             username_str = str(username).strip()
             
@@ -1031,28 +1042,27 @@ def login_page():
             st.info(f"Attempting login with ID: '{username_str}'")
             
             # Check if users dataframe is loaded correctly
-            if 'users' not in st.session_state or st.session_state.users.empty:
+            users = get_users()
+            if users.empty:
                 st.error("User database is not loaded correctly")
                 initialize_data()  # Try to reinitialize data
                 st.rerun()
                 
-            user_match = st.session_state.users[
-                (st.session_state.users['username'] == username_str) & 
-                (st.session_state.users['password'] == hashed_pwd)
-            ]
+            # Check credentials (keyed lookup, hashed on the shared worker pool)
+            valid, role = validate_user(username_str, password)
 
-            if not user_match.empty:
+            if valid:
                 st.success(f"Login successful!")
                 st.session_state.authenticated = True
                 st.session_state.current_user = username_str
-                st.session_state.user_role = user_match.iloc[0]['role']
+                st.session_state.user_role = role
                 st.rerun()
             else:
                 # Debug info to help troubleshoot
                 st.error("Invalid username or password")
                 
                 # Check if user exists but password doesn't match
-                user_exists = username_str in st.session_state.users['username'].values
+                user_exists = get_user(username_str) is not None
                 if user_exists:
                     st.info(f"Note: User ID exists but password doesn't match. Please try again. The default admin password is '222222222'.")
                 else:
@@ -1063,7 +1073,19 @@ def login_page():
                     
                 # Show all available usernames for debugging (remove in production)
                 with st.expander("Available User IDs (for testing)"):
-                    st.write(st.session_state.users[['username', 'role', 'first_name', 'last_name']])
+                    st.write(users[['username', 'role', 'first_name', 'last_name']])
+
+def profiler_panel():
+    """Debug panel with section and data call timings (only shown with DMD_PROFILE=1)"""
+    with st.expander("Performance (debug)", expanded=False):
+        st.caption("Times per rerun section and per data call. p50/p95 are histogram bucket bounds.")
+        st.markdown("**This session**")
+        st.dataframe(pd.DataFrame(st.session_state.profile.summary()), hide_index=True, use_container_width=True)
+        st.markdown("**All sessions on this server**")
+        st.dataframe(pd.DataFrame(process_profile.summary()), hide_index=True, use_container_width=True)
+        st.markdown("**Caches**")
+        caches = [dict(cache=name, **stats) for name, stats in cache_stats().items()]
+        st.dataframe(pd.DataFrame(caches), hide_index=True, use_container_width=True)
 
 def logout_user():
     """Handle user logout"""
@@ -1081,7 +1103,8 @@ if "logout_clicked" in st.session_state and st.session_state.logout_clicked:
 
 # Main app logic
 if not st.session_state.authenticated:
-    login_page()
+    with section("Login"):
+        login_page()
 else:
     # Hide sidebar
     st.markdown("""
@@ -1097,6 +1120,8 @@ else:
         athlete_device_checkout()
     elif st.session_state.user_role == 'coach' or st.session_state.user_role == 'specialist':
         admin_device_overview()
+        if PROFILING:
+            profiler_panel()
 
     # Create a container in the corner for the logout button
     logout_container = st.container()
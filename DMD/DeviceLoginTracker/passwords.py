@@ -0,0 +1,67 @@
+import hashlib
+import hmac
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+# PBKDF2 cost for new hashes; stored hashes with fewer iterations are
+# re-hashed on the next successful login
+PASSWORD_ITERATIONS = int(os.environ.get('DMD_PASSWORD_ITERATIONS', 600000))
+
+# Hashing runs on a small fixed pool so a burst of logins (shift change) can
+# only use this many cores, while other sessions keep rerunning. hashlib
+# releases the GIL during PBKDF2, so the workers run in parallel.
+HASH_WORKERS = int(os.environ.get('DMD_HASH_WORKERS', 4))
+
+_hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='password-hash')
+
+# Used to spend the same time on unknown usernames as on wrong passwords
+_DUMMY_HASH = None
+
+
+def _pbkdf2(password, salt, iterations):
+    """Hex PBKDF2-HMAC-SHA256 digest"""
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+
+
+def _hash(password, iterations):
+    """Build a 'pbkdf2_sha256$iterations$salt$hash' string with a fresh salt"""
+    salt = secrets.token_hex(16)
+    return f"pbkdf2_sha256${iterations}${salt}${_pbkdf2(password, salt, iterations)}"
+
+
+def _verify(password, stored):
+    """Check a password against a stored hash, returns (matches, needs_rehash)"""
+    if stored.startswith('pbkdf2_sha256$'):
+        try:
+            _, iterations, salt, expected = stored.split('$')
+            iterations = int(iterations)
+        except ValueError:
+            return False, False
+        matches = hmac.compare_digest(_pbkdf2(password, salt, iterations), expected)
+        return matches, matches and iterations < PASSWORD_ITERATIONS
+
+    # Older accounts store an unsalted SHA-256 hex digest
+    legacy = hashlib.sha256(password.encode()).hexdigest()
+    matches = hmac.compare_digest(legacy, str(stored))
+    return matches, matches
+
+
+def hash_password(password):
+    """Hash a password with a random salt (runs on the hashing pool)"""
+    return _hash_pool.submit(_hash, password, PASSWORD_ITERATIONS).result()
+
+
+def verify_password(password, stored):
+    """Check a password against a stored hash (runs on the hashing pool)
+
+    Returns (matches, needs_rehash); needs_rehash is True for a correct
+    password stored as legacy SHA-256 or with fewer than PASSWORD_ITERATIONS.
+    """
+    if stored is None:
+        global _DUMMY_HASH
+        if _DUMMY_HASH is None:
+            _DUMMY_HASH = hash_password(secrets.token_hex(8))
+        _hash_pool.submit(_verify, password, _DUMMY_HASH).result()
+        return False, False
+    return _hash_pool.submit(_verify, password, stored).result()
@@ -0,0 +1,173 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# Profiling is opt-in (DMD_PROFILE=1). When it is off, profiled() returns the
+# function unchanged and section() a shared no-op context, so the only cost
+# is one function call per section.
+PROFILING = os.environ.get('DMD_PROFILE', '') not in ('', '0')
+
+# Histogram bucket upper bounds in seconds (the usual Prometheus latency buckets)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NO_SECTION = nullcontext()
+
+
+class Histogram:
+    """Count of durations per bucket, plus their sum and the largest one"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        """Add one duration"""
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (the max for the last bucket)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Profile:
+    """Histograms keyed by (kind, name): kind is 'section' or 'call'"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, kind, name, seconds):
+        """Record one duration"""
+        with self.lock:
+            histogram = self.histograms.get((kind, name))
+            if histogram is None:
+                histogram = self.histograms[(kind, name)] = Histogram()
+            histogram.observe(seconds)
+
+    def summary(self):
+        """One dict per histogram with count, mean, p50, p95 and max in milliseconds"""
+        with self.lock:
+            items = sorted(self.histograms.items())
+            return [
+                {
+                    'Kind': kind,
+                    'Name': name,
+                    'Count': histogram.count,
+                    'Mean (ms)': round(histogram.total / histogram.count * 1000, 2),
+                    'p50 (ms)': round(histogram.quantile(0.5) * 1000, 2),
+                    'p95 (ms)': round(histogram.quantile(0.95) * 1000, 2),
+                    'Max (ms)': round(histogram.max * 1000, 2),
+                }
+                for (kind, name), histogram in items
+            ]
+
+
+# Everything recorded in this server process, across sessions
+process_profile = Profile()
+
+# Streamlit runs each rerun of a session on one thread; main.py points this
+# at the session's own Profile at the top of every rerun
+_current = threading.local()
+
+
+def use_session_profile(profile):
+    """Also record this thread's timings into profile (None to stop)"""
+    _current.profile = profile
+
+
+def record(kind, name, seconds):
+    """Add a duration to the process profile and to the current session's"""
+    process_profile.observe(kind, name, seconds)
+    session = getattr(_current, 'profile', None)
+    if session is not None:
+        session.observe(kind, name, seconds)
+
+
+@contextmanager
+def _timed_section(name):
+    """Record how long the with-block took under name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record('section', name, time.perf_counter() - start)
+
+
+def section(name):
+    """Context manager timing a named part of the page (no-op unless profiling)"""
+    if not PROFILING:
+        return _NO_SECTION
+    return _timed_section(name)
+
+
+def profiled(func):
+    """Decorator timing each call of a data function (returns func itself unless profiling)"""
+    if not PROFILING:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record('call', func.__name__, time.perf_counter() - start)
+    return wrapper
+
+
+def _label(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(profile=process_profile):
+    """The profile in the Prometheus text exposition format"""
+    lines = [
+        '# HELP dmd_profiling_enabled Whether timings are being recorded (DMD_PROFILE)',
+        '# TYPE dmd_profiling_enabled gauge',
+        f'dmd_profiling_enabled {int(PROFILING)}',
+        '# HELP dmd_duration_seconds Time spent in dashboard sections and data calls',
+        '# TYPE dmd_duration_seconds histogram',
+    ]
+    with profile.lock:
+        for (kind, name), histogram in sorted(profile.histograms.items()):
+            labels = f'kind="{kind}",name="{_label(name)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'dmd_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'dmd_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'dmd_duration_seconds_sum{{{labels}}} {histogram.total}')
+            lines.append(f'dmd_duration_seconds_count{{{labels}}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def prometheus_cache_text(caches):
+    """Cache counters, {cache name: {'hits', 'misses', 'size'}}, in the Prometheus text format"""
+    lines = []
+    for metric, key, kind, help_text in [
+        ('dmd_cache_hits_total', 'hits', 'counter', 'Lookups answered from an in-process cache'),
+        ('dmd_cache_misses_total', 'misses', 'counter', 'Lookups an in-process cache had to compute'),
+        ('dmd_cache_entries', 'size', 'gauge', 'Entries held by an in-process cache'),
+    ]:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, stats in sorted(caches.items()):
+            lines.append(f'{metric}{{cache="{_label(name)}"}} {stats[key]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,89 @@
+import pandas as pd
+from devices import DEVICE_RANGES
+
+ASSIGNMENT_COLUMNS = ['device_id', 'employee_name', 'checkout_time', 'checkin_time', 'device_type']
+USER_COLUMNS = ['username', 'password', 'role', 'first_name', 'last_name']
+
+DEVICE_TYPES = [name for name, _, _ in DEVICE_RANGES]
+USER_ROLES = ['athlete', 'coach', 'specialist']
+
+# Assignment columns the dashboard filters on; each store keeps a count of
+# rows per value of these (the facet index) for the filter dropdowns
+FACET_COLUMNS = ['device_id', 'device_type', 'employee_name']
+
+# Compact dtypes for the assignments frame: device IDs are small ints, the
+# repeated strings are categorical (integer codes plus one copy of each value)
+# and a missing check-in time (NaT) means the device is still out
+DEVICE_TYPE_DTYPE = pd.CategoricalDtype(DEVICE_TYPES)
+ASSIGNMENT_DTYPES = {
+    'device_id': 'int16',
+    'employee_name': 'category',
+    'checkout_time': 'datetime64[ns]',
+    'checkin_time': 'datetime64[ns]',
+    'device_type': DEVICE_TYPE_DTYPE,
+}
+
+
+def assignment_frame(data=None):
+    """Build an assignments frame with the compact schema
+
+    Accepts a DataFrame or anything pd.DataFrame() takes (e.g. a list of row
+    dicts). Raises ValueError for a device type outside DEVICE_RANGES.
+    """
+    if isinstance(data, pd.DataFrame):
+        frame = data.reindex(columns=ASSIGNMENT_COLUMNS)
+    else:
+        frame = pd.DataFrame(data, columns=ASSIGNMENT_COLUMNS)
+    if frame.empty:
+        return frame.astype(ASSIGNMENT_DTYPES)
+
+    device_type = frame['device_type'].astype(str).astype(DEVICE_TYPE_DTYPE)
+    unknown = device_type.isna() & frame['device_type'].notna()
+    if unknown.any():
+        raise ValueError(f"Unknown device type: {frame['device_type'][unknown].iloc[0]}")
+
+    return pd.DataFrame({
+        'device_id': pd.to_numeric(frame['device_id']).astype('int16'),
+        'employee_name': frame['employee_name'].astype(str).astype('category'),
+        'checkout_time': pd.to_datetime(frame['checkout_time']).astype('datetime64[ns]'),
+        'checkin_time': pd.to_datetime(frame['checkin_time']).astype('datetime64[ns]'),
+        'device_type': device_type,
+    }, index=frame.index)
+
+
+def coerce_assignment(assignment):
+    """Return a checkout dict with the schema's types, raising ValueError if it does not fit"""
+    if assignment['device_type'] not in DEVICE_TYPES:
+        raise ValueError(f"Unknown device type: {assignment['device_type']}")
+    checkin_time = assignment.get('checkin_time')
+    return {
+        'device_id': int(assignment['device_id']),
+        'employee_name': str(assignment['employee_name']),
+        'checkout_time': pd.Timestamp(assignment['checkout_time']),
+        'checkin_time': None if checkin_time is None or pd.isna(checkin_time) else pd.Timestamp(checkin_time),
+        'device_type': assignment['device_type'],
+    }
+
+
+def user_frame(data=None):
+    """Build a users frame: text columns as strings, role as a categorical"""
+    if isinstance(data, pd.DataFrame):
+        frame = data.reindex(columns=USER_COLUMNS)
+    else:
+        frame = pd.DataFrame(data, columns=USER_COLUMNS)
+    frame = frame.copy()
+    for col in ['username', 'password', 'first_name', 'last_name']:
+        frame[col] = frame[col].fillna('').astype(str)
+    # Keep any role the file already has rather than dropping it
+    roles = USER_ROLES + sorted(set(frame['role'].dropna().astype(str)) - set(USER_ROLES))
+    frame['role'] = frame['role'].astype(pd.CategoricalDtype(roles))
+    return frame
+
+
+def sort_key(checkout_time, device_id):
+    """History sort key shared by every place assignments are kept
+
+    A device can only be checked out once at a given instant, so
+    (checkout time, device ID) identifies a row and breaks ties.
+    """
+    return (pd.Timestamp(checkout_time).value, int(device_id))
@@ -0,0 +1,420 @@
+import sqlite3
+import threading
+import pandas as pd
+from devices import DeviceAvailability
+from store import DEVICE_CHECKED_OUT, TYPE_ALREADY_HELD
+from schema import (
+    ASSIGNMENT_COLUMNS, USER_COLUMNS, FACET_COLUMNS, assignment_frame, coerce_assignment, user_frame
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL,
+    first_name TEXT NOT NULL DEFAULT '',
+    last_name TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    id INTEGER PRIMARY KEY,
+    device_id INTEGER NOT NULL,
+    employee_name TEXT NOT NULL,
+    checkout_time TEXT NOT NULL,
+    checkin_time TEXT,
+    device_type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_assignments_device_open
+    ON assignments (device_id, checkin_time IS NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_assignments_device_out
+    ON assignments (device_id) WHERE checkin_time IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_assignments_holder_out
+    ON assignments (employee_name, device_type) WHERE checkin_time IS NULL;
+CREATE INDEX IF NOT EXISTS idx_assignments_employee_type
+    ON assignments (employee_name, device_type);
+CREATE INDEX IF NOT EXISTS idx_assignments_checkout_time
+    ON assignments (checkout_time);
+CREATE INDEX IF NOT EXISTS idx_assignments_device_time
+    ON assignments (device_id, checkout_time);
+CREATE INDEX IF NOT EXISTS idx_assignments_employee_time
+    ON assignments (employee_name, checkout_time);
+
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+
+-- Facet index: rows per device ID, device type and employee (name is the column)
+CREATE TABLE IF NOT EXISTS facets (
+    name TEXT NOT NULL,
+    value NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (name, value)
+);
+"""
+
+# Data version: every write to users or assignments bumps meta.version in the
+# same transaction, so every replica sees the change and drops its cached views
+VERSION_TRIGGERS = {
+    f"version_{table}_{event.lower()}":
+        f"CREATE TRIGGER IF NOT EXISTS version_{table}_{event.lower()} AFTER {event} ON {table} "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END"
+    for table in ('assignments', 'users') for event in ('INSERT', 'UPDATE', 'DELETE')
+}
+
+# Facet counts follow every row added, removed or moved to another value
+_FACETS_ADD = (
+    "INSERT INTO facets (name, value, count) VALUES "
+    "('device_id', NEW.device_id, 1), ('device_type', NEW.device_type, 1), ('employee_name', NEW.employee_name, 1) "
+    "ON CONFLICT (name, value) DO UPDATE SET count = count + 1;"
+)
+_FACETS_REMOVE = (
+    "UPDATE facets SET count = count - 1 WHERE (name = 'device_id' AND value = OLD.device_id) "
+    "OR (name = 'device_type' AND value = OLD.device_type) "
+    "OR (name = 'employee_name' AND value = OLD.employee_name); "
+    "DELETE FROM facets WHERE count <= 0;"
+)
+FACET_TRIGGERS = {
+    'facets_assignments_insert':
+        f"CREATE TRIGGER IF NOT EXISTS facets_assignments_insert AFTER INSERT ON assignments "
+        f"BEGIN {_FACETS_ADD} END",
+    'facets_assignments_update':
+        f"CREATE TRIGGER IF NOT EXISTS facets_assignments_update "
+        f"AFTER UPDATE OF device_id, device_type, employee_name ON assignments "
+        f"BEGIN {_FACETS_REMOVE} {_FACETS_ADD} END",
+    'facets_assignments_delete':
+        f"CREATE TRIGGER IF NOT EXISTS facets_assignments_delete AFTER DELETE ON assignments "
+        f"BEGIN {_FACETS_REMOVE} END",
+}
+
+
+def _to_sql_time(value):
+    """Format a timestamp as sortable ISO text, or None"""
+    if value is None or pd.isna(value):
+        return None
+    return pd.Timestamp(value).isoformat(sep=' ')
+
+
+class SQLiteStore:
+    """Storage engine keeping users and assignments in a SQLite database
+
+    Offers the same methods as AssignmentStore, but availability checks and
+    history filters run as indexed queries instead of scans of pandas frames.
+    The database runs in WAL mode so readers never block the writer.
+
+    Several app processes (replicas behind a load balancer) can share one
+    database file. Unique partial indexes allow only one open row per device
+    and per (employee, device type), so a checkout is a conditional insert:
+    the database rejects it at commit time if another replica got there first.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT value FROM meta WHERE key = 'facets_counted'").fetchone() is None:
+                # Databases from before the facet index: count the existing rows once
+                self._count_facets(conn)
+                conn.execute("INSERT INTO meta (key, value) VALUES ('facets_counted', datetime('now'))")
+            for sql in list(VERSION_TRIGGERS.values()) + list(FACET_TRIGGERS.values()):
+                conn.execute(sql)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conn(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql, params=(), columns=ASSIGNMENT_COLUMNS):
+        """Run a SELECT and return the rows as a DataFrame"""
+        rows = self._conn().execute(sql, params).fetchall()
+        if columns is ASSIGNMENT_COLUMNS:
+            return assignment_frame(rows)
+        if columns is USER_COLUMNS:
+            return user_frame(rows)
+        return pd.DataFrame(rows, columns=columns)
+
+    @staticmethod
+    def _count_facets(conn):
+        """Rebuild the facet index from the assignments table"""
+        conn.execute("DELETE FROM facets")
+        for column in FACET_COLUMNS:
+            conn.execute(
+                f"INSERT INTO facets (name, value, count) "
+                f"SELECT '{column}', {column}, COUNT(*) FROM assignments GROUP BY {column} ORDER BY MIN(id)"
+            )
+
+    def get_version(self):
+        """Return a number that increases whenever users or assignments change (on any replica)"""
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0])
+
+    # Migration
+
+    def is_migrated(self):
+        """True once the CSV files have been imported"""
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'migrated_from_csv'").fetchone()
+        return row is not None
+
+    def migrate(self, users, assignments):
+        """One-time import of the users and assignments frames loaded from CSV"""
+        conn = self._conn()
+        with self.lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_csv'").fetchone() is None:
+                    # Bump the version and count the facets once for the whole
+                    # import instead of once per row
+                    for name in list(VERSION_TRIGGERS) + list(FACET_TRIGGERS):
+                        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO users (username, password, role, first_name, last_name) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        users[USER_COLUMNS].itertuples(index=False, name=None)
+                    )
+                    conn.executemany(
+                        "INSERT INTO assignments (device_id, employee_name, checkout_time, checkin_time, device_type) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [
+                            (int(row.device_id), str(row.employee_name), _to_sql_time(row.checkout_time),
+                             _to_sql_time(row.checkin_time), row.device_type)
+                            for row in assignments.itertuples(index=False)
+                        ]
+                    )
+                    conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_csv', datetime('now'))")
+                    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+                    self._count_facets(conn)
+                    for sql in list(VERSION_TRIGGERS.values()) + list(FACET_TRIGGERS.values()):
+                        conn.execute(sql)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    # Users
+
+    def get_users(self):
+        """Return all users as a frame"""
+        return self._query(
+            "SELECT username, password, role, first_name, last_name FROM users ORDER BY rowid",
+            columns=USER_COLUMNS
+        )
+
+    def get_user_directory(self):
+        """Return the users frame indexed by username"""
+        return self.get_users().set_index('username', drop=False)
+
+    def get_user(self, username):
+        """Return a user's row as a Series, or None if the user does not exist"""
+        row = self._conn().execute(
+            "SELECT username, password, role, first_name, last_name FROM users WHERE username = ?",
+            (username,)
+        ).fetchone()
+        if row is None:
+            return None
+        return user_frame([row]).iloc[0]
+
+    def add_user(self, user):
+        """Add a user (a dict keyed by USER_COLUMNS), returns False if the username is taken"""
+        cursor = self._conn().execute(
+            "INSERT OR IGNORE INTO users (username, password, role, first_name, last_name) VALUES (?, ?, ?, ?, ?)",
+            [user[col] for col in USER_COLUMNS]
+        )
+        return cursor.rowcount == 1
+
+    def update_users(self, changes):
+        """Apply {username: {column: value}} edits to the roster in one transaction"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for username, fields in changes.items():
+                for col, value in fields.items():
+                    if col not in USER_COLUMNS:
+                        raise ValueError(f"Unknown user column: {col}")
+                    conn.execute(f"UPDATE users SET {col} = ? WHERE username = ?", (value, username))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def remove_user(self, username):
+        """Remove a user from the roster"""
+        self._conn().execute("DELETE FROM users WHERE username = ?", (username,))
+
+    # Assignments
+
+    def get_assignments(self):
+        """Return every assignment as a frame"""
+        return self._query(
+            "SELECT device_id, employee_name, checkout_time, checkin_time, device_type FROM assignments ORDER BY id"
+        )
+
+    def get_active_assignments(self):
+        """Return the assignments that have not been checked in"""
+        return self._query(
+            "SELECT device_id, employee_name, checkout_time, checkin_time, device_type FROM assignments "
+            "WHERE checkin_time IS NULL ORDER BY id"
+        )
+
+    def get_available_devices(self, device_type):
+        """Return the IDs of the free devices of one type"""
+        # Other processes may share the database, so rebuild the bitmap from
+        # the (small) set of open rows rather than caching it
+        availability = DeviceAvailability()
+        rows = self._conn().execute("SELECT device_id FROM assignments WHERE checkin_time IS NULL").fetchall()
+        for (device_id,) in rows:
+            availability.mark_out(device_id)
+        return availability.available(device_type)
+
+    def _history_where(self, device_id, device_type, employee_name, start, end):
+        """Build the WHERE conditions and parameters for a history query"""
+        conditions = []
+        params = []
+        if device_id is not None:
+            conditions.append("device_id = ?")
+            params.append(int(device_id))
+        if device_type is not None:
+            conditions.append("device_type = ?")
+            params.append(device_type)
+        if employee_name is not None:
+            conditions.append("employee_name = ?")
+            params.append(employee_name)
+        if start is not None:
+            conditions.append("checkout_time >= ?")
+            params.append(_to_sql_time(start))
+        if end is not None:
+            conditions.append("checkout_time <= ?")
+            params.append(_to_sql_time(end))
+        return conditions, params
+
+    def get_history(self, device_id=None, device_type=None, employee_name=None, start=None, end=None):
+        """Return assignments matching the filters, newest checkout first"""
+        conditions, params = self._history_where(device_id, device_type, employee_name, start, end)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        return self._query(
+            "SELECT device_id, employee_name, checkout_time, checkin_time, device_type FROM assignments "
+            f"{where}ORDER BY checkout_time DESC, id DESC",
+            params
+        )
+
+    def count_history(self, device_id=None, device_type=None, employee_name=None, start=None, end=None):
+        """Count the assignments matching the filters"""
+        conditions, params = self._history_where(device_id, device_type, employee_name, start, end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._conn().execute(f"SELECT COUNT(*) FROM assignments {where}", params).fetchone()[0]
+
+    def get_history_page(self, limit, cursor=None, device_id=None, device_type=None,
+                         employee_name=None, start=None, end=None):
+        """Return one page of history, newest first, and the cursor for the next page"""
+        conditions, params = self._history_where(device_id, device_type, employee_name, start, end)
+        if cursor is not None:
+            conditions.append("(checkout_time, id) < (?, ?)")
+            params.extend(cursor)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self._conn().execute(
+            "SELECT device_id, employee_name, checkout_time, checkin_time, device_type, id FROM assignments "
+            f"{where}ORDER BY checkout_time DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1][2], rows[-1][5])
+        frame = assignment_frame([row[:5] for row in rows])
+        return frame, next_cursor
+
+    def get_facet_counts(self, column):
+        """Return {value: number of assignments} for a facet column (from the facet index)"""
+        if column not in FACET_COLUMNS:
+            raise ValueError(f"Unknown facet column: {column}")
+        rows = self._conn().execute(
+            "SELECT value, count FROM facets WHERE name = ? ORDER BY rowid", (column,)
+        ).fetchall()
+        return dict(rows)
+
+    def checkout(self, assignment):
+        """Check out a device (a dict keyed by ASSIGNMENT_COLUMNS)
+
+        Returns None on success, or DEVICE_CHECKED_OUT / TYPE_ALREADY_HELD.
+        """
+        return self.checkout_many([assignment])[0]
+
+    def checkout_many(self, assignments):
+        """Check out several devices in one transaction
+
+        Returns one result per assignment (None or a refusal code). Either
+        every row is committed or the transaction is rolled back.
+        """
+        assignments = [coerce_assignment(assignment) for assignment in assignments]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            results = [self._insert_checkout(conn, assignment) for assignment in assignments]
+            if any(result is not None for result in results):
+                conn.execute("ROLLBACK")
+            else:
+                conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    @staticmethod
+    def _insert_checkout(conn, assignment):
+        """Insert one open assignment row, returns None or the refusal code"""
+        try:
+            conn.execute(
+                "INSERT INTO assignments (device_id, employee_name, checkout_time, checkin_time, device_type) "
+                "VALUES (?, ?, ?, NULL, ?)",
+                (assignment['device_id'], assignment['employee_name'],
+                 _to_sql_time(assignment['checkout_time']), assignment['device_type'])
+            )
+        except sqlite3.IntegrityError as e:
+            # The unique index that refused the row tells us why
+            if 'assignments.device_id' in str(e):
+                return DEVICE_CHECKED_OUT
+            if 'assignments.employee_name' in str(e):
+                return TYPE_ALREADY_HELD
+            raise
+        return None
+
+    def checkin(self, device_id, checkin_time):
+        """Check in a device, returns False if it was not checked out"""
+        return self.checkin_many([device_id], checkin_time)[0]
+
+    def checkin_many(self, device_ids, checkin_time):
+        """Check in several devices in one transaction
+
+        Returns one bool per device. Either every device is checked in or the
+        transaction is rolled back.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            results = [
+                conn.execute(
+                    "UPDATE assignments SET checkin_time = ? WHERE device_id = ? AND checkin_time IS NULL",
+                    (_to_sql_time(checkin_time), int(device_id))
+                ).rowcount > 0
+                for device_id in device_ids
+            ]
+            if all(results):
+                conn.execute("COMMIT")
+            else:
+                conn.execute("ROLLBACK")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return results
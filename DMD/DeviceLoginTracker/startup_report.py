@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# What a container restart has to finish before the first page can render
+DEFAULT_BUDGET = 1.0
+
+# Run in a fresh interpreter so nothing is already imported or loaded
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import pandas
+timings = {'import pandas': time.perf_counter() - start}
+mark = time.perf_counter()
+import utils
+timings['import utils'] = time.perf_counter() - mark
+mark = time.perf_counter()
+utils.initialize_data()
+timings['initialize data'] = time.perf_counter() - mark
+timings['total'] = time.perf_counter() - start
+print(json.dumps({'timings': timings, 'steps': utils.startup_timings,
+                  'modules': sorted(m for m in sys.modules if '.' not in m)}))
+"""
+
+# Modules that should only be imported when a feature needs them
+LAZY_MODULES = ['user_agents', 'streamlit']
+
+
+def measure(app_dir):
+    """Start a fresh Python in app_dir, import utils and open the store; returns the probe's report"""
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', _PROBE], cwd=app_dir, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how long a cold start takes to load the store')
+    parser.add_argument('--dir', default='.', help='folder with users.csv, the journal and the archive')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help='seconds allowed (default 1.0)')
+    parser.add_argument('--runs', type=int, default=3, help='cold starts to measure; the slowest counts')
+    args = parser.parse_args()
+
+    # First-run setup (hashing the default admin's password, creating the empty
+    # files, the SQLite import) happens once per data folder, not on every
+    # restart, so one unmeasured start does it before the timed ones
+    measure(args.dir)
+    reports = [measure(args.dir) for _ in range(args.runs)]
+    slowest = max(reports, key=lambda report: report['timings']['total'])
+
+    print(f"Storage engine: {os.environ.get('DMD_STORAGE', 'journal')}, slowest of {args.runs} cold starts "
+          f"(after one unmeasured start that sets the folder up)")
+    for name, seconds in slowest['timings'].items():
+        print(f"  {name:20} {seconds * 1000:8.1f} ms")
+    for name, seconds in slowest['steps'].items():
+        print(f"    {name:18} {seconds * 1000:8.1f} ms")
+
+    eager = [name for name in LAZY_MODULES if name in slowest['modules']]
+    if eager:
+        print(f"Imported at startup but should be lazy: {', '.join(eager)}")
+
+    total = slowest['timings']['total']
+    if total > args.budget or eager:
+        print(f"FAIL: {total:.2f} s (budget {args.budget:.2f} s)")
+        sys.exit(1)
+    print(f"OK: {total:.2f} s (budget {args.budget:.2f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,718 @@
+import bisect
+import threading
+from array import array
+import numpy as np
+import pandas as pd
+from devices import DeviceAvailability
+from journal import Journal, read_journal, write_csv_atomic
+from schema import (
+    USER_COLUMNS, DEVICE_TYPES, DEVICE_TYPE_DTYPE, FACET_COLUMNS,
+    assignment_frame, coerce_assignment, user_frame, sort_key
+)
+
+# Reasons a checkout can be refused, shared by every storage engine
+DEVICE_CHECKED_OUT = 'device_checked_out'
+TYPE_ALREADY_HELD = 'type_already_held'
+
+# Rewrite the assignments checkpoint after this many journal records
+CHECKPOINT_EVERY = 1000
+
+# Rewrite users.csv after this many user journal records
+USERS_COMPACT_EVERY = 100
+
+# Check-in time stored for a device that is still out (reads back as NaT)
+NOT_RETURNED = pd.NaT.value
+
+
+class AssignmentStore:
+    """Users and device assignments shared by every session in the server process
+
+    Streamlit runs each browser session on its own thread inside one process, so
+    keeping the frames here (instead of in st.session_state) gives every iPad the
+    same view of which devices are out. All writes go through the lock.
+
+    When a journal is attached, every checkout and check-in is appended to it
+    before being acknowledged, and the assignments frame is periodically
+    written out to checkpoint_path so restarts only replay a short journal.
+    Roster changes work the same way with their own journal: each add, edit
+    or removal appends one record, and users_path is only rewritten (atomically)
+    when the journal is compacted.
+
+    Assignments are kept as append-only typed columns (see schema.py): int16
+    device IDs, int32 employee codes into one list of names, int8 device type
+    codes and int64 nanosecond timestamps, about 23 bytes per row. Two indexes
+    point at the rows still checked out: device_id -> row and (employee code,
+    type code) -> row, so checkout, check-in and the active list never scan
+    history. A DeviceAvailability bitmap mirrors the device index for the
+    dropdowns. The full frame is built on demand and cached until the next
+    write.
+
+    For history queries the rows are also kept in (checkout time, device ID)
+    order, with per-device and per-employee posting lists in the same order.
+    A query starts from the shortest matching list and narrows the date range
+    by binary search, so it only touches the rows it returns, and the other
+    filters compare integer codes.
+
+    With an archive attached, each checkpoint moves returned assignments out
+    of memory into the month-partitioned AssignmentArchive, so the live rows
+    (and the checkpoint file) hold little more than the open checkouts.
+    History queries combine both.
+
+    The facet index counts the rows (live and archived) per device ID, device
+    type and employee. It is built on first use and then bumped by every
+    added row; rows moving to the archive leave the totals unchanged.
+    """
+
+    def __init__(self, users, assignments, journal=None, checkpoint_path=None, users_path=None,
+                 archive=None, users_journal=None):
+        self.lock = threading.RLock()
+        self.users = user_frame(users)
+        self._directory = None
+        self.journal = journal
+        self.checkpoint_path = checkpoint_path
+        self.users_path = users_path
+        self.users_journal = users_journal
+        self.archive = archive
+        self._records_since_checkpoint = 0
+        self._user_records_since_compact = 0
+        # Bumped on every change to the users or assignments, so derived
+        # views can be cached per version (see utils.cached_view)
+        self.version = 0
+        # Facet index ({column: {value: rows}}), built by get_facet_counts()
+        self._facets = None
+        self._reset_rows(assignments)
+
+    @classmethod
+    def open(cls, users, checkpoint, checkpoint_path, journal_path, users_path=None, archive=None,
+             users_journal_path=None):
+        """Rebuild the store from the last checkpoint plus the journal on disk"""
+        store = cls(users, checkpoint, checkpoint_path=checkpoint_path, users_path=users_path,
+                    archive=archive)
+
+        if users_journal_path is not None:
+            # Roster records are idempotent, so a rotated journal left by an
+            # interrupted compaction can simply be replayed again
+            user_records = read_journal(users_journal_path + '.old') + read_journal(users_journal_path)
+            store.replay_users(user_records)
+            last_seq = max([r['seq'] for r in user_records], default=0)
+            store.users_journal = Journal(users_journal_path, last_seq=last_seq)
+            if user_records:
+                store.compact_users()
+
+        # Pending archive files mean a checkpoint was interrupted after moving
+        # returned rows to the archive. Whether or not the checkpoint file was
+        # replaced, those rows now belong to the archive only.
+        archived = set()
+        if archive is not None:
+            pending = archive.read_pending()
+            archived = {
+                sort_key(row.checkout_time, row.device_id)
+                for row in pending.itertuples(index=False)
+            }
+            if archived:
+                live = store._live_frame()
+                keep = [
+                    sort_key(row.checkout_time, row.device_id) not in archived
+                    for row in live.itertuples(index=False)
+                ]
+                store._reset_rows(live[keep])
+
+        # A leftover rotated journal means a checkpoint was interrupted, so its
+        # records may or may not already be in the checkpoint file
+        rotated = read_journal(journal_path + '.old')
+        store.replay(rotated, idempotent=True, archived=archived)
+        records = read_journal(journal_path)
+        store.replay(records)
+
+        last_seq = max([r['seq'] for r in rotated + records], default=0)
+        store.journal = Journal(journal_path, last_seq=last_seq)
+        if rotated or records or archived:
+            store.checkpoint()
+        return store
+
+    def get_version(self):
+        """Return a number that increases whenever users or assignments change"""
+        return self.version
+
+    # Users
+
+    def get_users(self):
+        """Return the current users frame"""
+        return self.users
+
+    def get_user_directory(self):
+        """Return the users frame indexed by username (cached until the roster changes)"""
+        with self.lock:
+            if self._directory is None:
+                users = self.users.drop_duplicates('username')
+                self._directory = users.set_index('username', drop=False)
+            return self._directory
+
+    def get_user(self, username):
+        """Return a user's row as a Series, or None if the user does not exist"""
+        directory = self.get_user_directory()
+        if username not in directory.index:
+            return None
+        return directory.loc[username]
+
+    def add_user(self, user):
+        """Add a user (a dict keyed by USER_COLUMNS), returns False if the username is taken"""
+        with self.lock:
+            if user['username'] in self.users['username'].values:
+                return False
+            seq = self._log_users({'op': 'add', 'user': {col: user[col] for col in USER_COLUMNS}})
+            self._apply_user_record({'op': 'add', 'user': user})
+        self._commit_users(seq)
+        return True
+
+    def update_users(self, changes):
+        """Apply {username: {column: value}} edits to the roster"""
+        for fields in changes.values():
+            for col in fields:
+                if col not in USER_COLUMNS:
+                    raise ValueError(f"Unknown user column: {col}")
+        with self.lock:
+            seq = self._log_users({'op': 'update', 'changes': changes})
+            self._apply_user_record({'op': 'update', 'changes': changes})
+        self._commit_users(seq)
+
+    def remove_user(self, username):
+        """Remove a user from the roster"""
+        with self.lock:
+            seq = self._log_users({'op': 'remove', 'username': username})
+            self._apply_user_record({'op': 'remove', 'username': username})
+        self._commit_users(seq)
+
+    def replay_users(self, records):
+        """Apply user journal records to the roster"""
+        with self.lock:
+            for record in records:
+                self._apply_user_record(record)
+
+    def compact_users(self):
+        """Rewrite users_path from the roster and truncate the user journal"""
+        if self.users_path is None:
+            return
+        with self.lock:
+            if self.users_journal is not None:
+                self.users_journal.rotate()
+            write_csv_atomic(self.users, self.users_path)
+            if self.users_journal is not None:
+                self.users_journal.discard_rotated()
+            self._user_records_since_compact = 0
+
+    def _apply_user_record(self, record):
+        """Apply one add / update / remove record to the users frame
+
+        Records are idempotent: an add for an existing username overwrites it.
+        """
+        if record['op'] == 'add':
+            user = record['user']
+            users = self.users[self.users['username'] != user['username']].astype({'role': str})
+            new_user = pd.DataFrame([user], columns=USER_COLUMNS)
+            self.users = user_frame(pd.concat([users, new_user], ignore_index=True))
+        elif record['op'] == 'update':
+            users = self.users.astype({'role': str})
+            for username, fields in record['changes'].items():
+                mask = users['username'] == username
+                for col, value in fields.items():
+                    users.loc[mask, col] = value
+            self.users = user_frame(users)
+        elif record['op'] == 'remove':
+            self.users = self.users[self.users['username'] != record['username']]
+        self._directory = None
+        self.version += 1
+
+    # Assignments
+
+    def get_assignments(self):
+        """Return every assignment, including archived ones, as a frame"""
+        live, archived = self._read_with_archive(
+            self._live_frame,
+            lambda snapshot: self.archive.scan(snapshot=snapshot)
+        )
+        if archived is None or archived.empty:
+            return live
+        return assignment_frame(pd.concat([archived, live], ignore_index=True))
+
+    def get_active_assignments(self):
+        """Return the assignments that have not been checked in"""
+        with self.lock:
+            return self._to_frame(sorted(self._open_by_device.values()))
+
+    def get_available_devices(self, device_type):
+        """Return the IDs of the free devices of one type"""
+        with self.lock:
+            return self._availability.available(device_type)
+
+    def get_history(self, device_id=None, device_type=None, employee_name=None, start=None, end=None):
+        """Return assignments matching the filters, newest checkout first"""
+        live, archived = self._read_with_archive(
+            lambda: self._to_frame(list(self._iter_history(device_id, device_type, employee_name, start, end))),
+            lambda snapshot: self.archive.scan(device_id, device_type, employee_name, start, end,
+                                               snapshot=snapshot)
+        )
+        if archived is None:
+            return live
+        return self._newest_first([live, archived])
+
+    def count_history(self, device_id=None, device_type=None, employee_name=None, start=None, end=None):
+        """Count the assignments matching the filters without building them"""
+        def count_live():
+            candidates, lo, hi, exact = self._history_range(device_id, device_type, employee_name, start, end)
+            if exact:
+                return hi - lo
+            return sum(1 for _ in self._iter_history(device_id, device_type, employee_name, start, end))
+
+        count, archived = self._read_with_archive(
+            count_live,
+            lambda snapshot: self.archive.count(device_id, device_type, employee_name, start, end,
+                                                snapshot=snapshot)
+        )
+        return count + (archived or 0)
+
+    def get_history_page(self, limit, cursor=None, device_id=None, device_type=None,
+                         employee_name=None, start=None, end=None):
+        """Return one page of history, newest first, and the cursor for the next page
+
+        cursor is the value returned with the previous page (None for the
+        first page); the returned cursor is None on the last page.
+        """
+        def live_page():
+            positions = []
+            for pos in self._iter_history(device_id, device_type, employee_name, start, end, cursor):
+                positions.append(pos)
+                if len(positions) > limit:
+                    break
+            return self._to_frame(positions)
+
+        page, archived = self._read_with_archive(
+            live_page,
+            lambda snapshot: self.archive.page(limit + 1, cursor, device_id, device_type, employee_name,
+                                               start, end, snapshot=snapshot)
+        )
+        if archived is not None:
+            # Older pages come from the archive; merge and keep the newest rows
+            page = self._newest_first([page, archived]).head(limit + 1)
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page.head(limit)
+            last = page.iloc[-1]
+            next_cursor = sort_key(last['checkout_time'], last['device_id'])
+        return page, next_cursor
+
+    def _read_with_archive(self, read_live, read_archive):
+        """Return (read_live(), read_archive(snapshot)) as one consistent view
+
+        The live rows and the archive's file list are taken together under the
+        lock, so a checkpoint cannot move rows from one to the other in
+        between (which would count them twice); the archive files are then
+        read without the lock. If a merge deleted one of those files
+        meanwhile, the read starts again. read_archive is skipped (None)
+        without an archive.
+        """
+        while True:
+            with self.lock:
+                live = read_live()
+                snapshot = self.archive.snapshot() if self.archive is not None else None
+            if snapshot is None:
+                return live, None
+            try:
+                return live, read_archive(snapshot)
+            except FileNotFoundError:
+                continue
+
+    def get_facet_counts(self, column):
+        """Return {value: number of assignments} for a facet column, archive included"""
+        if column not in FACET_COLUMNS:
+            raise ValueError(f"Unknown facet column: {column}")
+        with self.lock:
+            if self._facets is None:
+                self._facets = self._count_facets()
+            return dict(self._facets[column])
+
+    def checkout(self, assignment):
+        """Check out a device (a dict keyed by ASSIGNMENT_COLUMNS)
+
+        Returns None on success, or DEVICE_CHECKED_OUT / TYPE_ALREADY_HELD.
+        """
+        return self.checkout_many([assignment])[0]
+
+    def checkout_many(self, assignments):
+        """Check out several devices in one transaction
+
+        Returns one result per assignment (None or a refusal code, as for
+        checkout). Either every assignment is applied, in a single journal
+        record and fsync, or none is.
+        """
+        assignments = [coerce_assignment(assignment) for assignment in assignments]
+        with self.lock:
+            results = []
+            taken_devices = set()
+            taken_holders = set()
+            for assignment in assignments:
+                # Check against the open rows and the earlier items in this batch
+                employee = self._employee_codes.get(assignment['employee_name'])
+                holder = (assignment['employee_name'], assignment['device_type'])
+                device_type = DEVICE_TYPES.index(assignment['device_type'])
+                if assignment['device_id'] in self._open_by_device or assignment['device_id'] in taken_devices:
+                    results.append(DEVICE_CHECKED_OUT)
+                elif (employee, device_type) in self._open_by_holder or holder in taken_holders:
+                    results.append(TYPE_ALREADY_HELD)
+                else:
+                    results.append(None)
+                taken_devices.add(assignment['device_id'])
+                taken_holders.add(holder)
+            if any(result is not None for result in results):
+                return results
+
+            seq = self._log_batch([{
+                'op': 'checkout',
+                'device_id': assignment['device_id'],
+                'employee_name': assignment['employee_name'],
+                'device_type': assignment['device_type'],
+                'checkout_time': assignment['checkout_time'].isoformat()
+            } for assignment in assignments])
+            for assignment in assignments:
+                self._add_row(assignment['device_id'], assignment['employee_name'],
+                              DEVICE_TYPES.index(assignment['device_type']),
+                              assignment['checkout_time'].value, NOT_RETURNED)
+        # Wait for the journal outside the lock so concurrent checkouts share an fsync
+        self._commit(seq)
+        return results
+
+    def checkin(self, device_id, checkin_time):
+        """Check in a device, returns False if it was not checked out"""
+        return self.checkin_many([device_id], checkin_time)[0]
+
+    def checkin_many(self, device_ids, checkin_time):
+        """Check in several devices in one transaction
+
+        Returns one bool per device (False if it was not checked out, or is
+        listed twice). Either every device is checked in, in a single journal
+        record and fsync, or none is.
+        """
+        device_ids = [int(device_id) for device_id in device_ids]
+        with self.lock:
+            results = []
+            seen = set()
+            for device_id in device_ids:
+                results.append(device_id in self._open_by_device and device_id not in seen)
+                seen.add(device_id)
+            if not all(results):
+                return results
+
+            positions = [self._open_by_device[device_id] for device_id in device_ids]
+            seq = self._log_batch([{
+                'op': 'checkin',
+                'device_id': self._device[pos],
+                'checkout_time': pd.Timestamp(self._checkout[pos]).isoformat(),
+                'checkin_time': checkin_time.isoformat()
+            } for pos in positions])
+            for pos in positions:
+                self._close_row(pos, pd.Timestamp(checkin_time).value)
+        self._commit(seq)
+        return results
+
+    # Durability
+
+    def replay(self, records, idempotent=False, archived=()):
+        """Apply journal records to the in-memory assignments
+
+        With idempotent=True, records already reflected in the rows (or in
+        the archived keys) are skipped; used for a journal whose checkpoint
+        may have completed.
+        """
+        with self.lock:
+            seen = None
+            if idempotent:
+                seen = {self._key(pos) for pos in range(len(self._device))}
+                seen.update(archived)
+            for record in self._flatten(records):
+                device_id = int(record['device_id'])
+                checkout_time = pd.Timestamp(record['checkout_time']).value
+                if record['op'] == 'checkout':
+                    if seen is not None and (checkout_time, device_id) in seen:
+                        continue
+                    self._add_row(device_id, str(record['employee_name']),
+                                  DEVICE_TYPES.index(record['device_type']), checkout_time, NOT_RETURNED)
+                elif record['op'] == 'checkin':
+                    pos = self._open_by_device.get(device_id)
+                    if pos is not None and self._checkout[pos] == checkout_time:
+                        self._close_row(pos, pd.Timestamp(record['checkin_time']).value)
+
+    def checkpoint(self):
+        """Write the live rows to checkpoint_path and truncate the journal
+
+        With an archive, returned rows are first written to it (as pending
+        files) and dropped from memory; the archive files are published once
+        the new checkpoint file is in place, and months with many files are
+        then merged.
+        """
+        if self.journal is None or self.checkpoint_path is None:
+            return
+        with self.lock:
+            self.journal.rotate()
+            if self.archive is not None:
+                live = self._live_frame()
+                returned = live['checkin_time'].notna()
+                if returned.any():
+                    self.archive.append(live[returned])
+                    self._reset_rows(live[~returned])
+            write_csv_atomic(self._live_frame(), self.checkpoint_path)
+            if self.archive is not None:
+                self.archive.publish_pending()
+                self.archive.compact()
+            self.journal.discard_rotated()
+            self._records_since_checkpoint = 0
+
+    def _commit(self, seq):
+        """Wait until a logged change is durable, checkpointing when due"""
+        if self.journal is None or seq is None:
+            return
+        self.journal.wait_durable(seq)
+        if self._records_since_checkpoint >= CHECKPOINT_EVERY:
+            self.checkpoint()
+
+    def _log(self, record):
+        """Queue a record on the journal, if there is one"""
+        if self.journal is None:
+            return None
+        self._records_since_checkpoint += 1
+        return self.journal.write(record)
+
+    def _log_batch(self, records):
+        """Queue records that must be replayed all together or not at all
+
+        A batch is a single journal line, so a torn write drops all of it.
+        """
+        if len(records) == 1:
+            return self._log(records[0])
+        if self.journal is None:
+            return None
+        self._records_since_checkpoint += len(records)
+        return self.journal.write({'op': 'batch', 'records': records})
+
+    @staticmethod
+    def _flatten(records):
+        """Yield journal records with batches expanded in order"""
+        for record in records:
+            if record['op'] == 'batch':
+                yield from record['records']
+            else:
+                yield record
+
+    def _log_users(self, record):
+        """Queue a roster record on the user journal, if there is one"""
+        if self.users_journal is None:
+            return None
+        self._user_records_since_compact += 1
+        return self.users_journal.write(record)
+
+    def _commit_users(self, seq):
+        """Wait until a roster change is durable, compacting when due"""
+        if self.users_journal is None:
+            # Without a journal the roster file is the only copy, so rewrite it
+            self.compact_users()
+            return
+        self.users_journal.wait_durable(seq)
+        if self._user_records_since_compact >= USERS_COMPACT_EVERY:
+            self.compact_users()
+
+    # Live rows and their indexes
+
+    def _reset_rows(self, assignments):
+        """Rebuild the live columns and every index from an assignments frame"""
+        frame = assignment_frame(assignments)
+        names = frame['employee_name'].cat
+        self._employees = [str(name) for name in names.categories]
+        self._employee_codes = {name: code for code, name in enumerate(self._employees)}
+
+        device = frame['device_id'].to_numpy(dtype=np.int16)
+        employee = names.codes.to_numpy(dtype=np.int32)
+        checkout = frame['checkout_time'].to_numpy().view(np.int64)
+        checkin = frame['checkin_time'].to_numpy().view(np.int64)
+        self._device = array('h', device.tobytes())
+        self._employee = array('i', employee.tobytes())
+        self._type = array('b', frame['device_type'].cat.codes.to_numpy(dtype=np.int8).tobytes())
+        self._checkout = array('q', checkout.tobytes())
+        self._checkin = array('q', checkin.tobytes())
+
+        # Posting lists of row positions, each in (checkout time, device ID) order
+        order = np.lexsort((device, checkout)).astype(np.int32)
+        self._time_order = array('i', order.tobytes())
+        self._by_device = self._group(device, order)
+        self._by_employee = self._group(employee, order)
+
+        self._open_by_device = {}
+        self._open_by_holder = {}
+        self._availability = DeviceAvailability()
+        for pos in np.flatnonzero(checkin == NOT_RETURNED).tolist():
+            self._mark_open(pos)
+        self._frame = None
+        self.version += 1
+
+    def _count_facets(self):
+        """Count the rows per facet value, archived rows first"""
+        facets = {}
+        live = self._live_frame()
+        for column in FACET_COLUMNS:
+            counts = self.archive.value_counts(column) if self.archive is not None else {}
+            live_counts = live[column].astype(object).value_counts(sort=False)
+            for value, count in zip(live_counts.index.tolist(), live_counts.tolist()):
+                counts[value] = counts.get(value, 0) + count
+            facets[column] = counts
+        return facets
+
+    @staticmethod
+    def _group(values, order):
+        """Split positions (in sort-key order) into one posting list per value"""
+        grouped = order[np.argsort(values[order], kind='stable')]
+        keys, starts = np.unique(values[grouped], return_index=True)
+        chunks = np.split(grouped, starts[1:])
+        return {int(key): array('i', chunk.tobytes()) for key, chunk in zip(keys, chunks)}
+
+    def _live_frame(self):
+        """Return the live rows as a frame (cached until the next write)"""
+        with self.lock:
+            if self._frame is None:
+                self._frame = self._to_frame()
+            return self._frame
+
+    def _key(self, pos):
+        """History sort key of a row: (checkout time in ns, device ID)"""
+        return (self._checkout[pos], self._device[pos])
+
+    def _add_row(self, device_id, employee_name, device_type, checkout_ns, checkin_ns):
+        """Append an assignment row and index it if it is still open"""
+        employee = self._employee_codes.get(employee_name)
+        if employee is None:
+            employee = len(self._employees)
+            self._employees.append(employee_name)
+            self._employee_codes[employee_name] = employee
+
+        pos = len(self._device)
+        self._device.append(device_id)
+        self._employee.append(employee)
+        self._type.append(device_type)
+        self._checkout.append(checkout_ns)
+        self._checkin.append(checkin_ns)
+        self._insert_in_order(self._time_order, pos)
+        self._insert_in_order(self._by_device.setdefault(device_id, array('i')), pos)
+        self._insert_in_order(self._by_employee.setdefault(employee, array('i')), pos)
+        if checkin_ns == NOT_RETURNED:
+            self._mark_open(pos)
+        if self._facets is not None:
+            for column, value in (('device_id', device_id), ('device_type', DEVICE_TYPES[device_type]),
+                                  ('employee_name', employee_name)):
+                counts = self._facets[column]
+                counts[value] = counts.get(value, 0) + 1
+        self._frame = None
+        self.version += 1
+
+    def _mark_open(self, pos):
+        """Add a row to the indexes of devices still checked out"""
+        self._open_by_device[self._device[pos]] = pos
+        self._open_by_holder[(self._employee[pos], self._type[pos])] = pos
+        self._availability.mark_out(self._device[pos])
+
+    def _history_range(self, device_id, device_type, employee_name, start, end, cursor=None):
+        """Pick the positions list for a history query and bound it by time
+
+        Returns (candidates, lo, hi, exact) where candidates[lo:hi] holds every
+        match in sort-key order, and exact is True when no further filtering
+        is needed.
+        """
+        # Start from the shortest posting list that applies
+        candidates = self._time_order
+        residual = 0
+        if device_id is not None:
+            candidates = self._by_device.get(int(device_id), ())
+        if employee_name is not None:
+            by_employee = self._by_employee.get(self._employee_codes.get(employee_name), ())
+            if device_id is not None:
+                residual += 1
+            if len(by_employee) < len(candidates):
+                candidates = by_employee
+        if device_type is not None:
+            if device_type not in DEVICE_TYPES:
+                candidates = ()
+            residual += 1
+
+        # Narrow to the date range (and cursor) by binary search on the sort key
+        lo = 0
+        hi = len(candidates)
+        if start is not None:
+            lo = bisect.bisect_left(candidates, (pd.Timestamp(start).value,), key=self._key)
+        if end is not None:
+            hi = bisect.bisect_left(candidates, (pd.Timestamp(end).value + 1,), key=self._key)
+        if cursor is not None:
+            hi = min(hi, bisect.bisect_left(candidates, tuple(cursor), key=self._key))
+        return candidates, lo, max(lo, hi), residual == 0
+
+    def _iter_history(self, device_id, device_type, employee_name, start, end, cursor=None):
+        """Yield the positions of matching rows, newest first"""
+        candidates, lo, hi, exact = self._history_range(device_id, device_type, employee_name, start, end, cursor)
+        if not exact:
+            # The remaining filters compare integer codes on rows inside the range only
+            device = int(device_id) if device_id is not None else None
+            employee = self._employee_codes.get(employee_name) if employee_name is not None else None
+            type_code = DEVICE_TYPES.index(device_type) if device_type in DEVICE_TYPES else None
+        for i in range(hi - 1, lo - 1, -1):
+            pos = candidates[i]
+            if not exact:
+                if device is not None and self._device[pos] != device:
+                    continue
+                if employee is not None and self._employee[pos] != employee:
+                    continue
+                if type_code is not None and self._type[pos] != type_code:
+                    continue
+            yield pos
+
+    def _insert_in_order(self, positions, pos):
+        """Add a row position to a list kept in sort-key order"""
+        # Checkouts almost always arrive in time order, making this an append
+        if not positions or self._key(positions[-1]) <= self._key(pos):
+            positions.append(pos)
+        else:
+            bisect.insort_right(positions, pos, key=self._key)
+
+    def _close_row(self, pos, checkin_ns):
+        """Set a row's check-in time and drop it from the open indexes"""
+        self._checkin[pos] = checkin_ns
+        self._open_by_device.pop(self._device[pos], None)
+        self._availability.mark_in(self._device[pos])
+        holder = (self._employee[pos], self._type[pos])
+        if self._open_by_holder.get(holder) == pos:
+            del self._open_by_holder[holder]
+        self._frame = None
+        self.version += 1
+
+    def _to_frame(self, positions=None):
+        """Build an assignments frame from the live columns (all rows by default)"""
+        def column(values, dtype):
+            data = np.frombuffer(values, dtype=dtype) if len(values) else np.empty(0, dtype=dtype)
+            return data.copy() if positions is None else data[np.asarray(positions, dtype=np.intp)]
+
+        return pd.DataFrame({
+            'device_id': column(self._device, np.int16),
+            'employee_name': pd.Categorical.from_codes(column(self._employee, np.int32),
+                                                       categories=self._employees),
+            'checkout_time': column(self._checkout, np.int64).view('datetime64[ns]'),
+            'checkin_time': column(self._checkin, np.int64).view('datetime64[ns]'),
+            'device_type': pd.Categorical.from_codes(column(self._type, np.int8), dtype=DEVICE_TYPE_DTYPE),
+        })
+
+    @staticmethod
+    def _newest_first(frames):
+        """Combine assignment frames and sort them newest first by the history sort key"""
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return assignment_frame()
+        combined = assignment_frame(pd.concat(frames, ignore_index=True))
+        order = combined.assign(
+            _time=combined['checkout_time'].astype('int64'),
+            _device=combined['device_id']
+        ).sort_values(['_time', '_device'], ascending=False).index
+        return combined.loc[order].reset_index(drop=True)
@@ -1,8 +1,68 @@
-import streamlit as st
 import pandas as pd
 from datetime import datetime
-import user_agents
-import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from devices import DEVICE_RANGES
+from store import AssignmentStore, DEVICE_CHECKED_OUT, TYPE_ALREADY_HELD
+from journal import write_csv_atomic
+from schema import assignment_frame, USER_ROLES
+from passwords import hash_password, verify_password
+from archive import AssignmentArchive
+from profiler import profiled
+
+# Storage engine: 'journal' (in-memory tables + append-only journal) or 'sqlite'
+STORAGE_ENGINE = os.environ.get('DMD_STORAGE', 'journal')
+SQLITE_PATH = os.environ.get('DMD_SQLITE_PATH', 'device_management.sqlite3')
+
+# Timestamp format for dashboard tables (strftime, and the equivalent for st.column_config)
+DISPLAY_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATETIME_COLUMN_FORMAT = "YYYY-MM-DD HH:mm:ss"
+
+# Process-wide store, created on first use by get_store()
+_store = None
+_store_init_lock = threading.Lock()
+
+# Derived views (active list, dropdown options, history pages) are computed
+# once per store version and shared by every session. Entries for older
+# versions are dropped as soon as the version changes; the size limit bounds
+# how many filter combinations are kept for the current one.
+VIEW_CACHE_SIZE = int(os.environ.get('DMD_VIEW_CACHE_SIZE', 256))
+_view_cache = OrderedDict()
+_view_cache_lock = threading.Lock()
+_view_cache_version = None
+_view_cache_stats = {'hits': 0, 'misses': 0}
+
+# Seconds spent in each step of opening the store, filled in by get_store()
+# and printed by startup_report.py
+startup_timings = {}
+
+def _timed(name, func, *args, **kwargs):
+    """Call func, recording how long it took in startup_timings"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    startup_timings[name] = time.perf_counter() - start
+    return result
+
+# Parsed user agents kept in memory; the fleet is a few tablet and phone
+# models, so a small cache holds every UA string the store actually sees
+USER_AGENT_CACHE_SIZE = 256
+
+@lru_cache(maxsize=USER_AGENT_CACHE_SIZE)
+def _parse_user_agent_cached(user_agent_string):
+    """Parse a non-empty user agent string (cached, shared by all sessions)"""
+    # Imported here: loading the user agent regexes takes ~0.3 s, which
+    # every restart would pay before the first page even if nobody logs in
+    import user_agents
+    user_agent = user_agents.parse(user_agent_string)
+    return {
+        'browser': user_agent.browser.family,
+        'os': user_agent.os.family,
+        'device': user_agent.device.family if user_agent.device.family != 'Other' else 'Desktop',
+        'is_mobile': user_agent.is_mobile or user_agent.is_tablet
+    }
 
 def parse_user_agent(user_agent_string):
     """Parse user agent string to get device information"""
@@ -10,179 +70,546 @@ def parse_user_agent(user_agent_string):
         return {
             'browser': 'Unknown',
             'os': 'Unknown',
-            'device': 'Unknown Device'
+            'device': 'Unknown Device',
+            'is_mobile': False
         }
-    user_agent = user_agents.parse(user_agent_string)
-    return {
-        'browser': user_agent.browser.family,
-        'os': user_agent.os.family,
-        'device': user_agent.device.family if user_agent.device.family != 'Other' else 'Desktop'
-    }
+    # Copy so a caller changing the dict cannot change the cached entry
+    return dict(_parse_user_agent_cached(user_agent_string))
 
-def hash_password(password):
-    """Create a hash of the password"""
-    return hashlib.sha256(password.encode()).hexdigest()
+def user_agent_cache_stats():
+    """Hit/miss counters of the user agent cache"""
+    info = _parse_user_agent_cached.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
 
-def initialize_data():
-    """Initialize DataFrames for users, devices, and logs with file persistence"""
-    import os
-    
+def cache_stats():
+    """Counters of this process's caches as {cache name: stats}, for the debug panel and /metrics"""
+    return {'user_agent': user_agent_cache_stats(), 'views': view_cache_stats()}
+
+def _default_users():
+    """Users frame holding only the main admin account"""
+    return pd.DataFrame({
+        'username': ['000001'],
+        'password': [hash_password('222222222')],
+        'role': ['coach'],
+        'first_name': ['Jelisha'],
+        'last_name': ['Joseph']
+    })
+
+def _load_users():
+    """Load users from users.csv, creating the default admin if needed"""
     # Check if users.csv exists, otherwise create with default admin
-    if 'users' not in st.session_state:
-        if os.path.exists('users.csv'):
-            try:
-                # Read with explicit data types to preserve leading zeros
-                st.session_state.users = pd.read_csv('users.csv', dtype={'username': str})
-                
-                # Convert NaN values to empty strings where necessary
-                for col in ['first_name', 'last_name']:
-                    if col in st.session_state.users.columns:
-                        st.session_state.users[col] = st.session_state.users[col].fillna('')
-                
-                # Ensure admin exists
-                if '000001' not in st.session_state.users['username'].values:
-                    admin_data = pd.DataFrame({
-                        'username': ['000001'],
-                        'password': [hash_password('222222222')],
-                        'role': ['coach'],
-                        'first_name': ['Jelisha'],
-                        'last_name': ['Joseph']
-                    })
-                    st.session_state.users = pd.concat([st.session_state.users, admin_data], ignore_index=True)
-                    # Save updated users to file
-                    st.session_state.users.to_csv('users.csv', index=False)
-                    
-            except Exception as e:
-                st.error(f"Error loading users: {e}")
-                # Create default admin if loading fails
-                users_data = {
-                    'username': ['000001'],
-                    'password': [hash_password('222222222')],
-                    'role': ['coach'],
-                    'first_name': ['Jelisha'],
-                    'last_name': ['Joseph']
-                }
-                st.session_state.users = pd.DataFrame(users_data)
-                # Save to file
-                st.session_state.users.to_csv('users.csv', index=False)
-        else:
-            # Create only the main admin account with updated credentials
-            users_data = {
-                'username': ['000001'],
-                'password': [hash_password('222222222')],
-                'role': ['coach'],
-                'first_name': ['Jelisha'],
-                'last_name': ['Joseph']
-            }
-            st.session_state.users = pd.DataFrame(users_data)
-            # Save to file
-            st.session_state.users.to_csv('users.csv', index=False)
-
-    # Load or create device assignments with file persistence
-    if 'device_assignments' not in st.session_state:
-        if os.path.exists('device_assignments.csv'):
-            try:
-                assignments = pd.read_csv('device_assignments.csv')
-                # Convert datetime columns
-                for col in ['checkout_time', 'checkin_time']:
-                    if col in assignments.columns:
-                        assignments[col] = pd.to_datetime(assignments[col])
-                st.session_state.device_assignments = assignments
-            except Exception:
-                # Create empty DataFrame if loading fails
-                st.session_state.device_assignments = pd.DataFrame(columns=[
-                    'device_id', 'employee_name', 'checkout_time', 'checkin_time', 'device_type'
-                ])
-                # Save empty dataframe to file
-                st.session_state.device_assignments.to_csv('device_assignments.csv', index=False)
-        else:
-            st.session_state.device_assignments = pd.DataFrame(columns=[
-                'device_id', 'employee_name', 'checkout_time', 'checkin_time', 'device_type'
-            ])
-            # Save empty dataframe to file
-            st.session_state.device_assignments.to_csv('device_assignments.csv', index=False)
+    if os.path.exists('users.csv'):
+        try:
+            # Read with explicit data types to preserve leading zeros
+            users = pd.read_csv('users.csv', dtype={'username': str})
+
+            # Convert NaN values to empty strings where necessary
+            for col in ['first_name', 'last_name']:
+                if col in users.columns:
+                    users[col] = users[col].fillna('')
+
+            # Ensure admin exists
+            if '000001' not in users['username'].values:
+                users = pd.concat([users, _default_users()], ignore_index=True)
+                # Save updated users to file
+                write_csv_atomic(users, 'users.csv')
+            return users
+        except Exception as e:
+            # The API server loads users too and does not import streamlit
+            import streamlit as st
+            st.error(f"Error loading users: {e}")
+
+    # Create only the main admin account with updated credentials
+    users = _default_users()
+    # Save to file
+    write_csv_atomic(users, 'users.csv')
+    return users
+
+def _load_assignments():
+    """Load device assignments from device_assignments.csv
+
+    Once a checkpoint has truncated the journal this file is the only copy of
+    the live rows, so a file that does not parse stops startup instead of
+    being replaced with an empty one.
+    """
+    if not os.path.exists('device_assignments.csv'):
+        # First run: start with an empty checkpoint
+        assignments = assignment_frame()
+        write_csv_atomic(assignments, 'device_assignments.csv')
+        return assignments
+    try:
+        # Read usernames as strings to preserve leading zeros
+        assignments = pd.read_csv(
+            'device_assignments.csv',
+            dtype={'device_id': 'int16', 'employee_name': str}
+        )
+        # Convert to the compact schema (categoricals, datetime64[ns])
+        return assignment_frame(assignments)
+    except Exception as e:
+        raise RuntimeError(
+            f"Could not read device_assignments.csv ({e}). The file has been left untouched; "
+            "fix or restore it before starting the dashboard."
+        ) from e
+
+def _open_journal_store():
+    """Open the in-memory store, replaying the assignments journal"""
+    users = _timed('load users', _load_users)
+    assignments = _timed('load assignments', _load_assignments)
+    return _timed('replay journal', AssignmentStore.open,
+        users,
+        assignments,
+        checkpoint_path='device_assignments.csv',
+        journal_path='device_assignments.journal',
+        users_path='users.csv',
+        users_journal_path='users.journal',
+        archive=AssignmentArchive('device_assignments_archive')
+    )
+
+def _open_sqlite_store():
+    """Open the SQLite store, importing the CSV files the first time"""
+    from sqlite_store import SQLiteStore
+    store = _timed('open sqlite', SQLiteStore, SQLITE_PATH)
+    if not store.is_migrated():
+        # Load through the journal store so any unreplayed checkouts come along
+        csv_store = _open_journal_store()
+        store.migrate(csv_store.get_users(), csv_store.get_assignments())
+    return store
+
+def get_store():
+    """Return the store shared by every session in this server process"""
+    global _store
+    if _store is None:
+        with _store_init_lock:
+            if _store is None:
+                start = time.perf_counter()
+                if STORAGE_ENGINE == 'sqlite':
+                    _store = _open_sqlite_store()
+                else:
+                    _store = _open_journal_store()
+                startup_timings['open store'] = time.perf_counter() - start
+    return _store
+
+@profiled
+def initialize_data():
+    """Load users and device assignments into the process-wide store (once per process)"""
+    get_store()
+
+def cached_view(name, compute, *args):
+    """Return compute(*args), reusing the result until the store version changes
+
+    The result is shared by every session, so callers must not modify it
+    (filtering, .copy() and .assign() make new frames and are fine).
+    """
+    global _view_cache_version
+    # The store is part of the version so a reopened store (whose counter
+    # starts again) never sees views from the old one
+    store = get_store()
+    version = (store, store.get_version())
+    key = (name, args)
+    with _view_cache_lock:
+        if version != _view_cache_version:
+            _view_cache.clear()
+            _view_cache_version = version
+        elif key in _view_cache:
+            _view_cache.move_to_end(key)
+            _view_cache_stats['hits'] += 1
+            return _view_cache[key]
+        _view_cache_stats['misses'] += 1
+
+    # Computed outside the lock; reading the version first means the result
+    # is at least as new as the version it is stored under
+    value = compute(*args)
+    with _view_cache_lock:
+        if version == _view_cache_version:
+            _view_cache[key] = value
+            while len(_view_cache) > VIEW_CACHE_SIZE:
+                _view_cache.popitem(last=False)
+    return value
+
+def clear_view_cache():
+    """Drop every cached view (the benchmark does this to time the data layer itself)"""
+    with _view_cache_lock:
+        _view_cache.clear()
+
+def view_cache_stats():
+    """Hit/miss counters and size of the derived view cache"""
+    with _view_cache_lock:
+        version = _view_cache_version[1] if _view_cache_version is not None else None
+        return dict(_view_cache_stats, size=len(_view_cache), max_size=VIEW_CACHE_SIZE, version=version)
+
+@profiled
+def get_users():
+    """Get the shared users table"""
+    return get_store().get_users()
+
+@profiled
+def get_user(username):
+    """Get a single user's row as a Series, or None if the user does not exist"""
+    return get_store().get_user(str(username))
+
+@profiled
+def get_user_directory():
+    """Get the users table indexed by username"""
+    return get_store().get_user_directory()
+
+@profiled
+def add_employee_names(frame):
+    """Add 'First Name' and 'Last Name' columns for each row's employee_name
+
+    Uses a single vectorized lookup against the username-keyed directory
+    instead of searching the users table once per row.
+    """
+    directory = get_user_directory()
+    # Plain strings, so pandas 2 does not return (and refuse to fill) a categorical
+    employee_names = frame['employee_name'].astype(object)
+    return frame.assign(**{
+        'First Name': employee_names.map(directory['first_name']).fillna(''),
+        'Last Name': employee_names.map(directory['last_name']).fillna('')
+    })
+
+def format_times(series, missing=""):
+    """Format a datetime column as display text in one vectorized pass"""
+    return pd.to_datetime(series).dt.strftime(DISPLAY_TIME_FORMAT).fillna(missing)
+
+@profiled
+def add_user(username, password, role, first_name, last_name):
+    """Add a new user, returns False if the Employee ID already exists"""
+    return get_store().add_user({
+        'username': username,
+        'password': hash_password(password),
+        'role': role,
+        'first_name': first_name,
+        'last_name': last_name
+    })
+
+@profiled
+def update_users(changes):
+    """Apply {username: {column: value}} edits to the roster"""
+    get_store().update_users(changes)
+
+def validate_user_changes(changes):
+    """Check {username: {column: value}} edits from the user table as one batch
+
+    Returns (errors, changes) where changes keeps only the values that differ
+    from the stored roster. Nothing should be saved if errors is not empty.
+    """
+    errors = []
+    directory = get_user_directory()
+    delta = {}
+    for username, fields in changes.items():
+        if username not in directory.index:
+            errors.append(f"User {username} no longer exists")
+            continue
+        current = directory.loc[username]
+        for col, value in fields.items():
+            if col not in ['first_name', 'last_name', 'role']:
+                errors.append(f"{col} cannot be edited in the table for {username}")
+                continue
+            value = '' if value is None else str(value).strip()
+            if col == 'role' and value not in USER_ROLES:
+                errors.append(f"Invalid role '{value}' for {username}")
+                continue
+            if value != current[col]:
+                delta.setdefault(username, {})[col] = value
+    return errors, delta
+
+@profiled
+def reset_password(username, password):
+    """Set a new password for a user, returns False if the user does not exist"""
+    if get_user(username) is None:
+        return False
+    update_users({username: {'password': hash_password(password)}})
+    return True
+
+@profiled
+def remove_user(username):
+    """Remove a user from the roster"""
+    get_store().remove_user(username)
 
 def get_device_type(device_id):
     """Determine device type based on ID range"""
-    device_id = int(device_id) if isinstance(device_id, str) else device_id
-    if 1 <= device_id <= 35:
-        return "Athlete Device"
-    elif 36 <= device_id <= 50:
-        return "Payment Terminal"
+    device_id = int(device_id)
+    for device_type, first, last in DEVICE_RANGES:
+        if first <= device_id <= last:
+            return device_type
     return "Unknown"
 
+@profiled
 def validate_user(username, password):
     """Validate user credentials and return role"""
-    user_data = st.session_state.users
     # Ensure username is treated as string
-    username = str(username)
-    user = user_data[user_data['username'] == username]
-    if not user.empty:
-        if user.iloc[0]['password'] == hash_password(password):
-            return True, user.iloc[0]['role']
-    return False, None
+    username = str(username).strip()
+    user = get_user(username)
+    stored = user['password'] if user is not None else None
+    matches, needs_rehash = verify_password(password, stored)
+    if not matches:
+        return False, None
+    if needs_rehash:
+        # Upgrade old SHA-256 (or cheaper PBKDF2) hashes now that we know the password
+        update_users({username: {'password': hash_password(password)}})
+    return True, user['role']
 
 def assign_device(username, device_id):
     """Assign a device to a user"""
-    # Check if device is already assigned
-    existing_assignment = st.session_state.device_assignments[
-        (st.session_state.device_assignments['device_id'] == device_id) & 
-        (st.session_state.device_assignments['checkin_time'].isna())
-    ]
-
-    if not existing_assignment.empty:
-        return False, "Device is already checked out by another athlete"
-
-    # Check if user already has a device of this type
-    device_type = get_device_type(device_id)
-    user_active_assignments = st.session_state.device_assignments[
-        (st.session_state.device_assignments['employee_name'] == username) & 
-        (st.session_state.device_assignments['checkin_time'].isna()) &
-        (st.session_state.device_assignments['device_type'] == device_type)
-    ]
-
-    if not user_active_assignments.empty:
-        return False, f"You already have a {device_type} checked out"
-
-    # Create new assignment
-    new_assignment = pd.DataFrame([{
+    success, messages = assign_devices(username, [device_id])
+    return success, messages[0]
+
+@profiled
+def assign_devices(username, device_ids):
+    """Check out several devices to one user in a single transaction
+
+    Either every device is checked out or none is. Returns (success, messages)
+    with one message per device.
+    """
+    device_types = [get_device_type(device_id) for device_id in device_ids]
+    unknown = [device_id for device_id, device_type in zip(device_ids, device_types) if device_type == "Unknown"]
+    if unknown:
+        return False, [
+            f"Device #{device_id} is not in the inventory" if device_id in unknown
+            else f"{device_type} #{device_id} was not checked out"
+            for device_id, device_type in zip(device_ids, device_types)
+        ]
+
+    checkout_time = datetime.now()
+    refusals = get_store().checkout_many([{
         'device_id': device_id,
         'employee_name': username,
-        'checkout_time': datetime.now(),
+        'checkout_time': checkout_time,
         'checkin_time': None,
-        'device_type': get_device_type(device_id)
-    }])
+        'device_type': device_type
+    } for device_id, device_type in zip(device_ids, device_types)])
 
-    st.session_state.device_assignments = pd.concat(
-        [st.session_state.device_assignments, new_assignment],
-        ignore_index=True
-    )
-    return True, f"Successfully checked out {device_type} #{device_id}"
+    success = all(refused is None for refused in refusals)
+    messages = []
+    for device_id, device_type, refused in zip(device_ids, device_types, refusals):
+        if refused == DEVICE_CHECKED_OUT:
+            messages.append("Device is already checked out by another athlete")
+        elif refused == TYPE_ALREADY_HELD:
+            messages.append(f"You already have a {device_type} checked out")
+        elif success:
+            messages.append(f"Successfully checked out {device_type} #{device_id}")
+        else:
+            messages.append(f"{device_type} #{device_id} was not checked out")
+    return success, messages
 
+@profiled
 def return_device(device_id):
     """Return a device"""
-    # Find active assignment
-    mask = (
-        (st.session_state.device_assignments['device_id'] == device_id) & 
-        (st.session_state.device_assignments['checkin_time'].isna())
-    )
+    return get_store().checkin(device_id, datetime.now())
 
-    if not mask.any():
-        return False
+def parse_checkout_pairs(text):
+    """Split pasted or uploaded text into (line number, employee ID, device ID) rows
 
-    # Update checkin time
-    st.session_state.device_assignments.loc[mask, 'checkin_time'] = datetime.now()
-    return True
+    Each line holds an Employee ID and a Device ID separated by a comma or tab
+    (or by spaces when there is neither). Blank lines and an
+    "Employee ID, Device ID" header on the first line are skipped; a line that
+    does not have exactly two values comes back with None for both.
+    """
+    rows = []
+    first_line = True
+    header = ['employee', 'id', 'device', 'id']
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if ',' in line or '\t' in line:
+            values = [value.strip() for value in line.replace('\t', ',').split(',')]
+            values = [value for value in values if value]
+        else:
+            values = line.split()
+        if not values:
+            continue
+        is_header = first_line and ' '.join(values).lower().split() == header
+        first_line = False
+        if is_header:
+            continue
+        if len(values) != 2:
+            rows.append((line_number, None, None))
+            continue
+        employee_name, device_id = values
+        rows.append((line_number, employee_name, device_id))
+    return rows
+
+@profiled
+def bulk_assign_devices(text):
+    """Check out every (employee, device) pair in the text in one transaction
+
+    Returns (success, report) where report is a frame with one row per input
+    line. Nothing is checked out unless every row is valid and available.
+    """
+    directory = get_user_directory()
+    report = []
+    batch = []
+    for line_number, employee_name, device_id in parse_checkout_pairs(text):
+        row = {'Line': line_number, 'Employee ID': employee_name or '', 'Device ID': device_id or '',
+               'Device Type': '', 'Result': ''}
+        report.append(row)
+        if employee_name is None:
+            row['Result'] = "Expected 'Employee ID, Device ID'"
+        elif employee_name not in directory.index:
+            row['Result'] = "Unknown Employee ID"
+        elif not device_id.isdigit() or get_device_type(device_id) == "Unknown":
+            row['Result'] = f"Device #{device_id} is not in the inventory"
+        else:
+            row['Device Type'] = get_device_type(device_id)
+            batch.append(row)
+
+    success = bool(batch) and len(batch) == len(report)
+    if success:
+        checkout_time = datetime.now()
+        refusals = get_store().checkout_many([{
+            'device_id': row['Device ID'],
+            'employee_name': row['Employee ID'],
+            'checkout_time': checkout_time,
+            'checkin_time': None,
+            'device_type': row['Device Type']
+        } for row in batch])
+        success = all(refused is None for refused in refusals)
+        for row, refused in zip(batch, refusals):
+            if refused == DEVICE_CHECKED_OUT:
+                row['Result'] = "Device is already checked out (or listed twice)"
+            elif refused == TYPE_ALREADY_HELD:
+                row['Result'] = f"Already has a {row['Device Type']} checked out (or listed twice)"
+
+    for row in batch:
+        if not row['Result']:
+            row['Result'] = "Checked out" if success else "Not checked out"
+    return success, pd.DataFrame(report, columns=['Line', 'Employee ID', 'Device ID', 'Device Type', 'Result'])
 
+@profiled
+def bulk_return_devices(device_ids):
+    """Return several devices in one transaction
+
+    Returns (success, report) with one row per device. Nothing is returned
+    unless every device is still checked out.
+    """
+    active = get_active_assignments().set_index('device_id')
+    results = get_store().checkin_many(device_ids, datetime.now())
+    success = all(results)
+    report = []
+    for device_id, returned in zip(device_ids, results):
+        holder = active['employee_name'].get(int(device_id), '')
+        if not returned:
+            result = "Not checked out (or listed twice)"
+        else:
+            result = "Returned" if success else "Not returned"
+        report.append({'Device ID': device_id, 'Employee ID': holder, 'Result': result})
+    return success, pd.DataFrame(report, columns=['Device ID', 'Employee ID', 'Result'])
+
+@profiled
+def get_assignments():
+    """Get every device assignment, active and returned"""
+    return get_store().get_assignments()
+
+@profiled
 def get_active_assignments():
-    """Get currently active device assignments"""
-    return st.session_state.device_assignments[
-        st.session_state.device_assignments['checkin_time'].isna()
-    ]
-
-def get_device_history():
-    """Get complete device assignment history"""
-    return st.session_state.device_assignments.sort_values(
-        by=['checkout_time'], 
-        ascending=False
-    )
\ No newline at end of file
+    """Get currently active device assignments (cached per store version)"""
+    return cached_view('active', get_store().get_active_assignments)
+
+@profiled
+def get_active_assignments_with_names():
+    """Active assignments with 'First Name' and 'Last Name' columns (cached per store version)"""
+    return cached_view('active_with_names', lambda: add_employee_names(get_active_assignments()))
+
+@profiled
+def get_device_history(device_id=None, device_type=None, employee_name=None, start=None, end=None):
+    """Get device assignment history, newest first, optionally filtered"""
+    return get_store().get_history(
+        device_id=device_id,
+        device_type=device_type,
+        employee_name=employee_name,
+        start=start,
+        end=end
+    )
+
+@profiled
+def get_available_devices(device_type):
+    """Get the IDs of devices of this type that are free to check out"""
+    return get_store().get_available_devices(device_type)
+
+@profiled
+def count_device_history(device_id=None, device_type=None, employee_name=None, start=None, end=None):
+    """Count the history rows matching the filters without loading them (cached per store version)"""
+    return cached_view('history_count', get_store().count_history,
+                       device_id, device_type, employee_name, start, end)
+
+@profiled
+def get_device_history_page(limit, cursor=None, device_id=None, device_type=None,
+                            employee_name=None, start=None, end=None):
+    """Get one page of history (newest first) and the cursor for the next page (cached per store version)"""
+    return cached_view('history_page', get_store().get_history_page,
+                       limit, cursor, device_id, device_type, employee_name, start, end)
+
+def _history_page_display(limit, cursor, device_id, device_type, employee_name, start, end):
+    """Build the History tab's page: (total, display frame, next cursor)"""
+    filters = {'device_id': device_id, 'device_type': device_type, 'employee_name': employee_name,
+               'start': start, 'end': end}
+    total = count_device_history(**filters)
+    history, next_cursor = get_device_history_page(limit, cursor=cursor, **filters)
+
+    # Format for display with vectorized strftime ("Not returned" needs a text column)
+    display = add_employee_names(history).assign(
+        checkout_time=format_times(history['checkout_time']),
+        checkin_time=format_times(history['checkin_time'], missing="Not returned")
+    )
+    display = display.rename(columns={
+        'device_id': 'Device ID',
+        'employee_name': 'Employee ID',
+        'checkout_time': 'Checkout Time',
+        'checkin_time': 'Check-in Time',
+        'device_type': 'Device Type'
+    })
+    columns = ['Device ID', 'Device Type', 'Employee ID', 'First Name', 'Last Name', 'Checkout Time', 'Check-in Time']
+    return total, display[columns], next_cursor
+
+@profiled
+def get_history_page_display(limit, cursor=None, device_id=None, device_type=None,
+                             employee_name=None, start=None, end=None):
+    """Get (total rows, formatted page, next cursor) for the History tab (cached per store version)"""
+    return cached_view('history_page_display', _history_page_display,
+                       limit, cursor, device_id, device_type, employee_name, start, end)
+
+@profiled
+def get_assignment_counts(column):
+    """Get {value: number of assignments} for a filter column (cached per store version)"""
+    return cached_view('facet_counts', get_store().get_facet_counts, column)
+
+@profiled
+def get_assignment_values(column):
+    """Get the distinct values of a filter column, for filter dropdowns"""
+    return list(get_assignment_counts(column))
+
+def _employee_labels(usernames, counts=None):
+    """{username: 'username - First Last'} for each username still on the roster, plus ' (rows)' with counts"""
+    directory = get_user_directory()
+    labels = {}
+    for username in usernames:
+        if username not in directory.index:
+            continue
+        label = f"{username} - {directory.at[username, 'first_name']} {directory.at[username, 'last_name']}"
+        if counts is not None:
+            label += f" ({counts[username]:,})"
+        labels[username] = label
+    return labels
+
+@profiled
+def get_athlete_options():
+    """Dropdown options for everyone who appears in the assignments (cached per store version)"""
+    return cached_view('athlete_options',
+                       lambda: list(_employee_labels(get_assignment_values('employee_name')).values()))
+
+def _athlete_labels():
+    """Label every athlete from the employee facet: one lookup per athlete"""
+    counts = get_assignment_counts('employee_name')
+    return _employee_labels(counts, counts)
+
+@profiled
+def get_athlete_labels():
+    """{username: label} for everyone in the assignments, e.g. "000002 - Ali Motley (14)" (cached per store version)
+
+    For a selectbox over usernames (format_func), so the option values stay
+    the same when the counts change.
+    """
+    return cached_view('athlete_labels', _athlete_labels)
+
+@profiled
+def get_user_options():
+    """Dropdown options for every user on the roster (cached per store version)"""
+    return cached_view('user_options', lambda: list(_employee_labels(get_users()['username'].tolist()).values()))